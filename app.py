@@ -1,12 +1,33 @@
-from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for
+from flask import Flask, render_template, request, jsonify, send_file, session, redirect, url_for, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from datetime import datetime
+import hashlib
+import json
 import os
+import time
 from functools import wraps
-from sqlalchemy import inspect, text
+from urllib.parse import quote
+from sqlalchemy import inspect, text, func, case, literal_column
+from sqlalchemy.orm import validates
+from sqlalchemy.exc import IntegrityError
+from werkzeug.datastructures import MultiDict
 from werkzeug.utils import secure_filename
+from pagination import parse_limit, decode_cursor, paginate
+from pricing import parse_price_range, price_band, PRICE_BANDS, PRICE_BAND_LOW, PRICE_BAND_HIGH
+from search import get_search_backend
+from stats_cache import stats_cache
+from coalesce import SingleFlight, clean_args, normalize_args
+from serialize import LIST_COLUMNS, LIST_FORMATS, dumps, rows_to_objects, rows_to_columns
+from compress import init_compression
+from db_config import engine_options, pool_status, init_route_timeouts, init_sqlite_pragmas
+from metrics import init_metrics, record_rows, count_rows
+from shared_storage import DEFAULT_STORAGE_URI, session_interface
+from result_cache import ResultCache, read_version, bump_version, ensure_version
+from changes import CHANGES_MAX_ROWS, CHANGES_RETENTION, encode_token, decode_token, window_start
+from events import (change_notifier, stream_slots, format_event, SSE_POLL_SECONDS, SSE_MAX_SECONDS,
+                    SSE_HEARTBEAT_SECONDS, SSE_RETRY_MS)
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-prod')
@@ -14,25 +35,58 @@ app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:/
 if app.config['SQLALCHEMY_DATABASE_URI'].startswith('postgres://'):
     app.config['SQLALCHEMY_DATABASE_URI'] = app.config['SQLALCHEMY_DATABASE_URI'].replace('postgres://', 'postgresql://')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# 連線池與 statement_timeout（PostgreSQL），可用環境變數調整，見 db_config.py
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config['SQLALCHEMY_DATABASE_URI'])
+# SQLite：WAL、synchronous=NORMAL 等 PRAGMA，讓匯入時讀取不被擋住
+init_sqlite_pragmas()
+
+# 限速計數與登入狀態存在所有 worker 共用的 SQLite 檔案（重啟後仍有效），見 shared_storage.py
+app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', DEFAULT_STORAGE_URI)
+app.config['SESSION_STORAGE_URI'] = os.environ.get('SESSION_STORAGE_URI', DEFAULT_STORAGE_URI)
+server_sessions = session_interface(app.config['SESSION_STORAGE_URI'])
+if server_sessions is not None:
+    app.session_interface = server_sessions
 
 db = SQLAlchemy(app)
 limiter = Limiter(get_remote_address, app=app, default_limits=[])
 
+# 匯出、匯入較耗資源的路由：每個使用者（未登入時為 IP）各自計算
+EXPORT_RATE_LIMIT = os.environ.get('EXPORT_RATE_LIMIT', '10 per minute')
+IMPORT_RATE_LIMIT = os.environ.get('IMPORT_RATE_LIMIT', '5 per minute')
+
+def rate_limit_key():
+    return session.get('username') or get_remote_address()
+
+# 請求耗時、SQL 次數、/metrics；先註冊，after_request 才會在壓縮之後執行、量到實際送出的大小
+init_metrics(app)
+init_compression(app)
+init_route_timeouts(app, db)
+
 # 資料庫模型
 class Doctor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100))
     email = db.Column(db.String(100))
-    specialty = db.Column(db.String(50))
-    gender = db.Column(db.String(10))
-    status = db.Column(db.String(20))
+    specialty = db.Column(db.String(50), index=True)
+    gender = db.Column(db.String(10), index=True)
+    status = db.Column(db.String(20))  # 由 ix_doctor_status_specialty 的前綴涵蓋
     contact_person = db.Column(db.String(50))
-    has_social_media = db.Column(db.String(10))  # 經營社群：是、否
+    has_social_media = db.Column(db.String(10), index=True)  # 經營社群：是、否
     social_media_link = db.Column(db.String(500))  # 醫師社群連結
     current_brand = db.Column(db.String(200))  # 目前合作品牌
     price_range = db.Column(db.String(100))  # 報價區間
+    price_min = db.Column(db.BigInteger)  # 報價數字下限（由 price_range 解析）
+    price_max = db.Column(db.BigInteger)  # 報價數字上限（由 price_range 解析）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)  # 變更紀錄（/api/doctors/changes）依此查詢
+
+    __table_args__ = (
+        # 最常見的篩選組合：狀態 + 科別（多選），結尾的 id 讓預設的 keyset 排序可以直接走索引；
+        # 也涵蓋 /api/stats 依狀態的統計
+        db.Index('ix_doctor_status_specialty', 'status', 'specialty', 'id'),
+        # 醫師名稱（與 email 相同）是匯入比對的鍵，upsert 的 ON CONFLICT 依賴這個唯一索引
+        db.Index('ux_doctor_name', 'name', unique=True),
+    )
 
     def to_dict(self):
         return {
@@ -51,6 +105,163 @@ class Doctor(db.Model):
             'updated_at': self.updated_at.strftime('%Y-%m-%d %H:%M:%S') if self.updated_at else None
         }
 
+    @validates('price_range')
+    def validate_price_range(self, key, value):
+        # 每次設定 price_range 時同步更新數字欄位（新增、編輯、匯入都會經過這裡）
+        self.price_min, self.price_max = parse_price_range(value)
+        return value
+
+# 刪除紀錄（給 /api/doctors/changes 回傳被刪除的 id，保存 CHANGES_RETENTION_DAYS 天）
+class DoctorDeletion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+# 資料版本號（每次寫入醫師資料時加一，各 worker 以此判斷列表快取與 ETag 是否過期，見 result_cache.py）
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+# 背景匯入工作（進度存在資料庫，多個 worker 都查得到）
+class ImportJob(db.Model):
+    id = db.Column(db.String(32), primary_key=True)
+    status = db.Column(db.String(20), default='queued')  # queued、running、succeeded、failed
+    mode = db.Column(db.String(20))
+    filename = db.Column(db.String(255))
+    total_rows = db.Column(db.Integer)  # 檔案沒有記錄尺寸時為空
+    rows_processed = db.Column(db.Integer, default=0)
+    success_count = db.Column(db.Integer, default=0)
+    error_count = db.Column(db.Integer, default=0)
+    errors = db.Column(db.Text)  # JSON 陣列（只保留前面的錯誤訊息）
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.utcnow()) - self.started_at).total_seconds()
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'mode': self.mode,
+            'filename': self.filename,
+            'total_rows': self.total_rows,
+            'rows_processed': self.rows_processed or 0,
+            'success_count': self.success_count or 0,
+            'error_count': self.error_count or 0,
+            'errors': json.loads(self.errors) if self.errors else [],
+            'elapsed_seconds': round(elapsed, 2) if elapsed is not None else None,
+            'rows_per_second': round((self.rows_processed or 0) / elapsed, 1) if elapsed else None,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None
+        }
+
+# 未填報價的醫師在升冪排序時排在最後；排序運算式與索引必須完全一致才會用到索引
+PRICE_SORT_NULL = 2 ** 62
+price_sort_expression = func.coalesce(Doctor.price_min, literal_column(str(PRICE_SORT_NULL)))
+
+db.Index('ix_doctor_price', Doctor.price_min, Doctor.price_max)
+db.Index('ix_doctor_price_sort', price_sort_expression, Doctor.id)
+
+# 報價區間分組（篩選與 facets 共用，規則與 pricing.price_band 相同）
+price_band_expression = case(
+    (Doctor.price_min.is_(None), 'none'),
+    (Doctor.price_min < PRICE_BAND_LOW, 'low'),
+    (Doctor.price_min <= PRICE_BAND_HIGH, 'mid'),
+    else_='high'
+)
+
+# facets 與統計共用的計數維度：依這些欄位分組計數
+FACET_COLUMNS = (Doctor.status, Doctor.specialty, Doctor.gender, Doctor.has_social_media, price_band_expression)
+
+def facet_key(doctor):
+    """一位醫師在計數中的鍵（順序與 FACET_COLUMNS 相同）"""
+    return (doctor.status, doctor.specialty, doctor.gender, doctor.has_social_media, price_band(doctor.price_min))
+
+def load_facet_counts():
+    """一次 GROUP BY 查詢取得所有維度組合的筆數"""
+    rows = db.session.query(*FACET_COLUMNS, func.count()).group_by(*FACET_COLUMNS).all()
+    return {tuple(row[:-1]): row[-1] for row in rows}
+
+# 狀態排序順序（與前端 statusOrder 一致，未知狀態排最後）
+STATUS_ORDER = {'已簽約': 0, '合作過': 1, '聯繫過': 2, '有經紀': 3, '未聯繫': 4}
+
+def build_doctor_query(args):
+    """依查詢參數建立醫師篩選查詢（搜尋、科別多選、性別、狀態、經營社群、報價區間）"""
+    search = search_term(args)
+    specialties = [s for s in args.getlist('specialty') if s]
+    gender = args.get('gender', '')
+    status = args.get('status', '')
+    has_social_media = args.get('has_social_media', '')
+    price_band = args.get('price_band', '')
+
+    query = Doctor.query
+
+    if search:
+        query = get_search_backend(db.engine).apply(query, Doctor, search)
+
+    if specialties:
+        query = query.filter(Doctor.specialty.in_(specialties))
+
+    if gender:
+        query = query.filter_by(gender=gender)
+
+    if status:
+        query = query.filter_by(status=status)
+
+    if has_social_media:
+        query = query.filter_by(has_social_media=has_social_media)
+
+    if price_band:
+        if price_band not in PRICE_BANDS:
+            raise ValueError(f'不支援的報價區間 {price_band}')
+        price = Doctor.price_min
+        if price_band == 'none':
+            query = query.filter(price.is_(None))
+        elif price_band == 'low':
+            query = query.filter(price < PRICE_BAND_LOW)
+        elif price_band == 'mid':
+            query = query.filter(price.between(PRICE_BAND_LOW, PRICE_BAND_HIGH))
+        elif price_band == 'high':
+            query = query.filter(price > PRICE_BAND_HIGH)
+
+    return query
+
+def search_term(args):
+    """搜尋關鍵字：q，相容舊的 search 參數"""
+    return (args.get('q') or args.get('search') or '').strip()
+
+def doctor_sort_expression(args):
+    """回傳 (排序運算式, 是否降冪)；未指定排序時，有搜尋關鍵字依相關度，否則依 id"""
+    sort = args.get('sort', '')
+    order = args.get('order', 'asc')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f'不支援的排序方向 {order}')
+
+    if not sort:
+        search = search_term(args)
+        rank = get_search_backend(db.engine).rank_expression(Doctor, search) if search else None
+        if rank is not None:
+            return rank, order == 'desc'
+        return Doctor.id, order == 'desc'
+    if sort == 'name':
+        expr = func.coalesce(func.nullif(Doctor.email, ''), func.nullif(Doctor.name, ''), '')
+    elif sort == 'price':
+        expr = price_sort_expression
+    elif sort == 'status':
+        expr = case(STATUS_ORDER, value=Doctor.status, else_=99)
+    else:
+        raise ValueError(f'不支援的排序欄位 {sort}')
+    return expr, order == 'desc'
+
+# 合併同時到達、參數相同的醫師列表查詢
+doctor_queries = SingleFlight()
+# 醫師列表的查詢結果（依資料版本號失效）
+doctor_results = ResultCache()
+
 # 權限裝飾器
 def admin_required(f):
     @wraps(f)
@@ -65,13 +276,21 @@ def admin_required(f):
 # 限速錯誤處理
 @app.errorhandler(429)
 def ratelimit_handler(e):
-    return jsonify({'error': '登入嘗試次數過多，請稍後再試'}), 429
+    if request.endpoint == 'login':
+        return jsonify({'error': '登入嘗試次數過多，請稍後再試'}), 429
+    return jsonify({'error': '請求過於頻繁，請稍後再試'}), 429
 
 # 路由
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def renew_session():
+    """登入成功時清空 session 並換發新的 session id，登入前（或其他帳號）的 session id 不能沿用"""
+    session.clear()
+    if hasattr(session, 'regenerate'):  # 伺服器端 session；簽章 cookie 的內容本身就會整個換掉
+        session.regenerate()
+
 @app.route('/login', methods=['POST'])
 @limiter.limit("5 per minute")
 def login():
@@ -84,11 +303,13 @@ def login():
     user_password  = os.environ.get('USER_PASSWORD',  'Bcm13011579')
 
     if username == 'admin' and password == admin_password:
+        renew_session()
         session['logged_in'] = True
         session['is_admin'] = True
         session['username'] = username
         return jsonify({'success': True, 'is_admin': True})
     elif username == 'user' and password == user_password:
+        renew_session()
         session['logged_in'] = True
         session['is_admin'] = False
         session['username'] = username
@@ -96,6 +317,22 @@ def login():
     else:
         return jsonify({'error': '帳號或密碼錯誤'}), 401
 
+@app.route('/healthz')
+def healthz():
+    """健康檢查：確認資料庫可連線，並回報連線池使用狀況（不需登入）"""
+    try:
+        db.session.execute(text('SELECT 1'))
+        database = 'ok'
+    except Exception as e:
+        db.session.rollback()
+        database = f'error: {e.__class__.__name__}'
+    healthy = database == 'ok'
+    return jsonify({
+        'status': 'ok' if healthy else 'error',
+        'database': database,
+        'pool': pool_status(db.engine)
+    }), 200 if healthy else 503
+
 @app.route('/logout', methods=['POST'])
 def logout():
     session.clear()
@@ -113,37 +350,182 @@ def check_auth():
 def get_doctors():
     if not session.get('logged_in'):
         return jsonify({'error': '請先登入'}), 401
-    
-    search = request.args.get('search', '')
-    specialty = request.args.get('specialty', '')
-    gender = request.args.get('gender', '')
-    status = request.args.get('status', '')
-    has_social_media = request.args.get('has_social_media', '')
-    
-    query = Doctor.query
-    
-    if search:
-        query = query.filter(
-            db.or_(
-                Doctor.email.contains(search),
-                Doctor.name.contains(search)
-            )
-        )
-    
-    if specialty:
-        query = query.filter_by(specialty=specialty)
-    
-    if gender:
-        query = query.filter_by(gender=gender)
-    
-    if status:
-        query = query.filter_by(status=status)
-    
-    if has_social_media:
-        query = query.filter_by(has_social_media=has_social_media)
-    
-    doctors = query.all()
-    return jsonify([doctor.to_dict() for doctor in doctors])
+
+    # 參數只整理一次（去空白、略過空值），查詢、排序、ETag 與快取鍵都用同一份
+    args = clean_args(request.args)
+    try:
+        query = build_doctor_query(args)
+        sort_expr, descending = doctor_sort_expression(args)
+        limit = parse_limit(args.get('limit'))
+        cursor = decode_cursor(args.get('cursor'))
+        list_format = args.get('format') or 'objects'
+        if list_format not in LIST_FORMATS:
+            raise ValueError(f'不支援的格式 {list_format}')
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數錯誤：{str(e)}'}), 400
+
+    # 在讀取版本號之前取得變更 token：之後的寫入都會出現在 /api/doctors/changes
+    changes_token = encode_token(datetime.utcnow())
+    # 資料表沒有變動且參數相同時回 304，不必執行查詢與序列化
+    version = doctor_table_version()
+    etag = doctor_list_etag(args, version)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag, weak=True)
+        # 304 的標頭會更新瀏覽器快取中的回應，讓快取的列表也拿到新的 token
+        response.headers['X-Changes-Token'] = changes_token
+        return response
+
+    def run_query():
+        # keyset 分頁：依 (排序值, id) 往後取一頁，深分頁與第一頁成本相同
+        # 只選列表需要的欄位，不建立 ORM 物件
+        page_query = query.with_entities(*[getattr(Doctor, name) for name in LIST_COLUMNS],
+                                         sort_expr.label('sort_key'))
+        rows, next_cursor = paginate(page_query, sort_expr, Doctor.id, limit, cursor, descending)
+        if list_format == 'columns':
+            payload = rows_to_columns(rows)
+        else:
+            payload = {'doctors': rows_to_objects(rows)}
+        payload['next_cursor'] = next_cursor
+        return dumps(payload), len(rows)
+
+    # 同一版本、同一組參數的結果直接從快取回傳；profile 請求略過快取，才量得到實際的查詢
+    cache_key = normalize_args(args)
+    use_cache = 'profile' not in args
+    cached = doctor_results.get(cache_key, version) if use_cache else None
+    shared = False
+    if cached is not None:
+        body, row_count = cached
+    else:
+        # 參數相同且仍在執行中的查詢只跑一次，同時到達的請求共用序列化後的結果
+        (body, row_count), shared = doctor_queries.do((version, cache_key), run_query)
+        if use_cache:
+            doctor_results.put(cache_key, version, body, row_count)
+    record_rows(row_count)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True  # 瀏覽器每次都要驗證
+    response.headers['X-Cache'] = 'HIT' if cached is not None else 'MISS'
+    response.headers['X-Changes-Token'] = changes_token
+    if shared:
+        response.headers['X-Coalesced'] = '1'
+    return response
+
+@app.route('/api/doctors/changes')
+def doctor_changes():
+    """
+    增量同步：since 之後新增或修改、且符合篩選條件的醫師，以及被刪除或不再符合條件的 id
+
+    篩選參數與 /api/doctors 相同。回應的 next 是下一次的 since；reset 為 true 時（變更太多或 token 過舊）
+    瀏覽器應重新載入整份列表。
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': '請先登入'}), 401
+
+    try:
+        since = decode_token(request.args.get('since'))
+        query = build_doctor_query(clean_args(request.args))
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數錯誤：{str(e)}'}), 400
+
+    payload = collect_changes(query, since)
+    record_rows(len(payload['doctors']))
+    response = app.response_class(dumps(payload), mimetype='application/json')
+    response.cache_control.no_store = True
+    return response
+
+def collect_changes(query, since):
+    """依篩選查詢 query 整理 since 之後的變更（/api/doctors/changes 與 /api/events 共用）"""
+    now = datetime.utcnow()
+    payload = {'doctors': [], 'removed': [], 'next': encode_token(now), 'reset': False}
+    start = window_start(since, now) if since is not None else None
+    if since is not None and start is None:
+        payload['reset'] = True
+    elif start is not None:
+        # updated_at 索引：只讀這段期間有變動的 id
+        changed_ids = [row.id for row in db.session.query(Doctor.id)
+                       .filter(Doctor.updated_at >= start)
+                       .limit(CHANGES_MAX_ROWS + 1)]
+        if len(changed_ids) > CHANGES_MAX_ROWS:
+            payload['reset'] = True
+        else:
+            rows = []
+            if changed_ids:
+                rows = (query.filter(Doctor.id.in_(changed_ids))
+                        .with_entities(*[getattr(Doctor, name) for name in LIST_COLUMNS])
+                        .order_by(Doctor.id).all())
+            matched = {row.id for row in rows}
+            deleted = {row.doctor_id for row in db.session.query(DoctorDeletion.doctor_id)
+                       .filter(DoctorDeletion.deleted_at >= start)}
+            payload['doctors'] = rows_to_objects(rows)
+            payload['removed'] = sorted((deleted | set(changed_ids)) - matched)
+    return payload
+
+@app.route('/api/events')
+def doctor_events():
+    """
+    即時更新（SSE）：資料版本號改變時推送 changes（依篩選條件）與 stats 事件，說明見 events.py
+
+    篩選參數與 /api/doctors 相同；since 為列表回應的 X-Changes-Token，重連時以 Last-Event-ID 為準。
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': '請先登入'}), 401
+
+    args = clean_args(request.args)
+    try:
+        since = decode_token(request.headers.get('Last-Event-ID') or args.get('since'))
+        build_doctor_query(args)
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數錯誤：{str(e)}'}), 400
+
+    if stream_slots is None:
+        # sync worker（或執行緒不足）時不開放，長連線會佔住整個 worker
+        return jsonify({'error': '伺服器未開放即時更新，請改用定期更新'}), 503
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({'error': '即時更新連線已滿，請改用定期更新'}), 503
+
+    def stream():
+        try:
+            yield f'retry: {SSE_RETRY_MS}\n\n'
+            token, version = since, None
+            seen = change_notifier.counter
+            started = last_sent = time.monotonic()
+            while time.monotonic() - started < SSE_MAX_SECONDS:
+                current = doctor_table_version()
+                if current != version:
+                    payload = collect_changes(build_doctor_query(args), token)
+                    token = decode_token(payload['next'])
+                    # 第一次只在有 since 時推送（補上連線前錯過的變更），之後每次版本改變都推送
+                    if version is not None or since is not None:
+                        yield format_event('changes', payload, payload['next'])
+                        stats_cache.sync_version(current)
+                        stats, _, _ = stats_cache.snapshot(load_facet_counts, 'stats')
+                        yield format_event('stats', stats)
+                        last_sent = time.monotonic()
+                    version = current
+                elif time.monotonic() - last_sent >= SSE_HEARTBEAT_SECONDS:
+                    yield ': ping\n\n'
+                    last_sent = time.monotonic()
+                # 等待時歸還資料庫連線；SQLite 也要結束讀取交易才看得到新的寫入
+                db.session.remove()
+                seen = change_notifier.wait(seen, SSE_POLL_SECONDS)
+        finally:
+            db.session.remove()
+            stream_slots.release()
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # 關閉反向代理的緩衝
+    return response
+
+def doctor_table_version():
+    """醫師資料的版本號（data_version 的一次主鍵查詢）；新增、修改、刪除、匯入都會加一"""
+    return read_version(db.session)
+
+def doctor_list_etag(args, version):
+    """列表的弱 ETag：資料版本號 + 正規化後的查詢參數"""
+    key = repr((version, normalize_args(args)))
+    return 'doctors-' + hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]
 
 @app.route('/api/doctors', methods=['POST'])
 def create_doctor():
@@ -169,9 +551,15 @@ def create_doctor():
         )
         
         db.session.add(doctor)
+        version = bump_version(db.session)
         db.session.commit()
+        stats_cache.add(facet_key(doctor), version=version)
+        change_notifier.notify()
         
         return jsonify(doctor.to_dict()), 201
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': '儲存失敗：已有相同名稱的醫師'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'儲存失敗：{str(e)}'}), 500
@@ -184,6 +572,7 @@ def update_doctor(id):
     try:
         doctor = Doctor.query.get_or_404(id)
         data = request.json
+        old_key = facet_key(doctor)
         
         # name 和 email 儲存同一個值（醫師名稱），同步更新
         display_value = data.get('name') or data.get('email')
@@ -199,9 +588,15 @@ def update_doctor(id):
         doctor.current_brand = data.get('current_brand', doctor.current_brand)
         doctor.price_range = data.get('price_range', doctor.price_range)
         
+        version = bump_version(db.session)
         db.session.commit()
+        stats_cache.move(old_key, facet_key(doctor), version=version)
+        change_notifier.notify()
         
         return jsonify(doctor.to_dict())
+    except IntegrityError:
+        db.session.rollback()
+        return jsonify({'error': '更新失敗：已有相同名稱的醫師'}), 409
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'更新失敗：{str(e)}'}), 500
@@ -211,43 +606,223 @@ def update_doctor(id):
 def delete_doctor(id):
     try:
         doctor = Doctor.query.get_or_404(id)
+        key = facet_key(doctor)
+        log_deletions(Doctor.id == id)
         db.session.delete(doctor)
+        version = bump_version(db.session)
         db.session.commit()
+        stats_cache.add(key, delta=-1, version=version)
+        change_notifier.notify()
         
         return jsonify({'message': '刪除成功'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'刪除失敗：{str(e)}'}), 500
 
+# 批次修改可以變更的欄位（醫師名稱是唯一鍵，不能批次修改）
+BATCH_UPDATE_FIELDS = ('specialty', 'gender', 'status', 'contact_person', 'has_social_media',
+                       'social_media_link', 'current_brand', 'price_range')
+MAX_BATCH_IDS = 5000
+# 批次操作的 filter 可用的篩選參數（與列表查詢相同）；其他參數（排序、分頁等）一律拒絕
+BATCH_FILTER_FIELDS = ('q', 'search', 'specialty', 'gender', 'status', 'has_social_media', 'price_band')
+
+def parse_batch_ids(ids):
+    """檢查 ids 是一串整數 id，回傳去除重複後的清單"""
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids 必須是非空的 id 陣列')
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f'一次最多 {MAX_BATCH_IDS} 筆')
+    if not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        raise ValueError('ids 只能包含整數')
+    return sorted(set(ids))
+
+def parse_batch_changes(changes):
+    """檢查要修改的欄位與值，回傳 UPDATE 的 SET 內容（含由 price_range 解析的數字欄位）"""
+    if not isinstance(changes, dict) or not changes:
+        raise ValueError('changes 必須是包含要修改欄位的物件')
+    unknown = [name for name in changes if name not in BATCH_UPDATE_FIELDS]
+    if unknown:
+        raise ValueError(f"不支援批次修改的欄位：{', '.join(unknown)}")
+    values = {}
+    for name, value in changes.items():
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f'{name} 必須是字串或 null')
+        values[name] = value
+    if 'price_range' in values:
+        # 批次 UPDATE 不會經過 @validates，在這裡同步數字欄位
+        values['price_min'], values['price_max'] = parse_price_range(values['price_range'])
+    values['updated_at'] = datetime.utcnow()
+    return values
+
+def batch_target(data):
+    """批次操作的對象：ids（id 陣列）或 filter（與列表查詢相同的篩選參數），回傳 WHERE 條件"""
+    if 'ids' in data:
+        return Doctor.id.in_(parse_batch_ids(data['ids']))
+    conditions = data.get('filter')
+    if not isinstance(conditions, dict):
+        raise ValueError('請指定 ids 或 filter')
+    unknown = sorted(name for name in conditions if name not in BATCH_FILTER_FIELDS)
+    if unknown:
+        raise ValueError(f'filter 不支援的參數：{", ".join(unknown)}')
+    pairs = []
+    for name, values in conditions.items():
+        for value in (values if isinstance(values, list) else [values]):
+            if value is None:
+                continue
+            if not isinstance(value, str):
+                raise ValueError(f'filter 的 {name} 必須是字串')
+            pairs.append((name, value))
+    # 與列表查詢相同的整理方式；空白的條件不算，至少要有一個實際的篩選
+    args = clean_args(MultiDict(pairs))
+    if not args:
+        raise ValueError('filter 不能是空的（不允許一次修改全部資料）')
+    return Doctor.id.in_(build_doctor_query(args).with_entities(Doctor.id))
+
+def finish_batch_write():
+    """批次寫入後：更新資料版本號（與寫入同一個交易）並提交，統計改為下次讀取時重新計算，通知 SSE 連線"""
+    bump_version(db.session)
+    db.session.commit()
+    stats_cache.mark_stale()
+    change_notifier.notify()
+
+def log_deletions(condition):
+    """在刪除前記下符合條件的醫師 id（與刪除同一個交易），並清除超過保存期限的舊紀錄"""
+    now = datetime.utcnow()
+    db.session.execute(db.insert(DoctorDeletion).from_select(
+        ['doctor_id', 'deleted_at'],
+        db.select(Doctor.id, db.literal(now, db.DateTime)).where(condition)
+    ))
+    db.session.execute(db.delete(DoctorDeletion).where(DoctorDeletion.deleted_at < now - CHANGES_RETENTION))
+
+@app.route('/api/doctors', methods=['PATCH'])
+def batch_update_doctors():
+    """
+    批次修改：{"ids": [...], "changes": {...}} 或 {"filter": {...}, "changes": {...}}
+
+    整批在同一個交易內以一個 UPDATE 完成，回傳實際修改的筆數。依篩選條件修改需要管理員權限。
+    """
+    if not session.get('logged_in'):
+        return jsonify({'error': '請先登入'}), 401
+
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': '批次修改參數錯誤：請求內容必須是 JSON 物件'}), 400
+    if 'ids' not in data and not session.get('is_admin'):
+        return jsonify({'error': '需要管理員權限'}), 403
+    try:
+        condition = batch_target(data)
+        values = parse_batch_changes(data.get('changes'))
+    except ValueError as e:
+        return jsonify({'error': f'批次修改參數錯誤：{str(e)}'}), 400
+
+    try:
+        result = db.session.execute(db.update(Doctor).where(condition).values(**values))
+        finish_batch_write()
+        return jsonify({'success': True, 'updated': result.rowcount})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'批次修改失敗：{str(e)}'}), 500
+
+@app.route('/api/doctors', methods=['DELETE'])
+@admin_required
+def batch_delete_doctors():
+    """批次刪除：{"ids": [...]}，以一個 DELETE 完成，回傳實際刪除的筆數"""
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': '批次刪除參數錯誤：請求內容必須是 JSON 物件'}), 400
+    try:
+        ids = parse_batch_ids(data.get('ids'))
+    except ValueError as e:
+        return jsonify({'error': f'批次刪除參數錯誤：{str(e)}'}), 400
+
+    try:
+        log_deletions(Doctor.id.in_(ids))
+        result = db.session.execute(db.delete(Doctor).where(Doctor.id.in_(ids)))
+        finish_batch_write()
+        return jsonify({'success': True, 'deleted': result.rowcount})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'批次刪除失敗：{str(e)}'}), 500
+
 @app.route('/api/stats')
 def get_stats():
     if not session.get('logged_in'):
         return jsonify({'error': '請先登入'}), 401
 
-    from sqlalchemy import func, case
-    result = db.session.query(
-        func.count().label('total'),
-        func.sum(case((Doctor.status == '已簽約', 1), else_=0)).label('contracted'),
-        func.sum(case((Doctor.status == '合作過', 1), else_=0)).label('cooperated'),
-    ).one()
+    # 計數保存在快取中，由新增、編輯、刪除增量維護，定期重新計算校正
+    return cached_counts_response('stats')
 
-    return jsonify({
-        'total': result.total or 0,
-        'contracted': result.contracted or 0,
-        'cooperated': result.cooperated or 0,
-    })
+@app.route('/api/facets')
+def get_facets():
+    """科別、狀態、性別、經營社群、報價區間各自的值與筆數（與 /api/stats 共用同一份計數）"""
+    if not session.get('logged_in'):
+        return jsonify({'error': '請先登入'}), 401
+
+    return cached_counts_response('facets')
+
+def cached_counts_response(view):
+    # 其他 worker 寫入後版本號會改變，這個程序內的計數需重新計算
+    stats_cache.sync_version(doctor_table_version())
+    payload, etag, last_modified = stats_cache.snapshot(load_facet_counts, view)
+    response = jsonify(payload)
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True  # 瀏覽器每次都要驗證，沒變動時回 304
+    return response.make_conditional(request)
 
 @app.route('/api/export')
+@limiter.shared_limit(EXPORT_RATE_LIMIT, scope='export', key_func=rate_limit_key)
 @admin_required
 def export_excel():
-    from export import export_doctors_to_excel
-    
-    doctors = Doctor.query.yield_per(500)
-    file_path = export_doctors_to_excel(doctors)
+    from export import stream_doctors_to_excel, EXPORT_COLUMNS
+
+    # 只查匯出需要的欄位並分批讀取，搭配 write_only 活頁簿，記憶體不隨資料量成長
+    doctors = (db.session.query(*[getattr(Doctor, name) for name in EXPORT_COLUMNS])
+               .order_by(Doctor.id)
+               .yield_per(500))
+    file_path = stream_doctors_to_excel(count_rows(doctors))
     
     return send_file(file_path, as_attachment=True, download_name='醫師資料.xlsx')
 
+def stream_export(args, render, mimetype, download_name):
+    """依 get_doctors 相同的篩選條件，邊讀 yield_per 游標邊送出資料"""
+    from export import STREAM_COLUMNS
+
+    args = clean_args(args)
+    try:
+        query = build_doctor_query(args)
+        sort_expr, descending = doctor_sort_expression(args)
+    except ValueError as e:
+        return jsonify({'error': f'查詢參數錯誤：{str(e)}'}), 400
+
+    if descending:
+        query = query.order_by(sort_expr.desc(), Doctor.id.desc())
+    else:
+        query = query.order_by(sort_expr.asc(), Doctor.id.asc())
+    rows = query.with_entities(*[getattr(Doctor, name) for name in STREAM_COLUMNS]).yield_per(500)
+
+    return Response(
+        stream_with_context(render(count_rows(rows))),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f"attachment; filename*=UTF-8''{quote(download_name)}"}
+    )
+
+@app.route('/api/export.csv')
+@limiter.shared_limit(EXPORT_RATE_LIMIT, scope='export', key_func=rate_limit_key)
+@admin_required
+def export_csv():
+    from export import iter_doctors_csv
+    return stream_export(request.args, iter_doctors_csv, 'text/csv', '醫師資料.csv')
+
+@app.route('/api/export.ndjson')
+@limiter.shared_limit(EXPORT_RATE_LIMIT, scope='export', key_func=rate_limit_key)
+@admin_required
+def export_ndjson():
+    from export import iter_doctors_ndjson
+    return stream_export(request.args, iter_doctors_ndjson, 'application/x-ndjson', '醫師資料.ndjson')
+
 @app.route('/api/import', methods=['POST'])
+@limiter.limit(IMPORT_RATE_LIMIT, key_func=rate_limit_key)
 @admin_required
 def import_excel():
     if 'file' not in request.files:
@@ -256,6 +831,18 @@ def import_excel():
     file = request.files['file']
     if file.filename == '':
         return jsonify({'error': '沒有選擇檔案'}), 400
+
+    # 匯入模式：skip（預設）跳過已存在的醫師，upsert 以檔案內容更新已存在的醫師
+    from import_data import IMPORT_MODES
+    mode = request.form.get('mode') or request.args.get('mode') or 'skip'
+    if mode not in IMPORT_MODES:
+        return jsonify({'error': f'不支援的匯入模式 {mode}'}), 400
+    if mode == 'upsert' and 'ux_doctor_name' not in existing_index_names():
+        return jsonify({
+            'success': False,
+            'error': '資料庫尚未升級',
+            'message': '更新模式需要醫師名稱唯一索引，請先執行 python upgrade_db.py'
+        }), 400
     
     # 檢查檔案格式（只支援 openpyxl 支援的格式）
     allowed_extensions = ('.xlsx', '.xlsm', '.xltx', '.xltm')
@@ -309,33 +896,19 @@ def import_excel():
                 'message': '無法保存上傳的檔案，請重試'
             }), 500
         
-        # 匯入資料
-        from import_data import import_doctors_from_excel
-        result = import_doctors_from_excel(file_path, db, Doctor)
-        
-        # 刪除臨時檔案
-        if file_path and os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except Exception as cleanup_error:
-                # 記錄清理錯誤但不影響結果
-                print(f"清理臨時檔案失敗: {cleanup_error}")
-        
-        if result.get('success'):
-            return jsonify({
-                'success': True,
-                'message': f'成功匯入 {result.get("success_count", 0)} 筆資料',
-                'success_count': result.get('success_count', 0),
-                'errors': result.get('errors', [])
-            })
-        else:
-            error_messages = result.get('errors', ['匯入失敗'])
-            return jsonify({
-                'success': False,
-                'error': '匯入失敗',
-                'message': error_messages[0] if error_messages else '匯入失敗',
-                'errors': error_messages
-            }), 500
+        # 建立匯入工作後立即回應，實際匯入在背景執行緒進行；前端以 job_id 查詢進度
+        from import_jobs import new_job_id, submit_import_job
+        job = ImportJob(id=new_job_id(), status='queued', mode=mode, filename=file.filename)
+        db.session.add(job)
+        db.session.commit()
+        submit_import_job(app, db, ImportJob, Doctor, job.id, file_path, mode)
+
+        return jsonify({
+            'success': True,
+            'job_id': job.id,
+            'status': job.status,
+            'status_url': url_for('import_status', job_id=job.id)
+        }), 202
             
     except Exception as e:
         # 確保清理臨時檔案
@@ -363,12 +936,57 @@ def import_excel():
             'errors': [friendly_msg]
         }), 500
 
+@app.route('/api/import/<job_id>')
+@admin_required
+def import_status(job_id):
+    from import_jobs import expire_stale_job
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return jsonify({'error': '找不到匯入工作'}), 404
+    if expire_stale_job(db, ImportJob, job):
+        db.session.refresh(job)
+    return jsonify(job.to_dict())
+
+
+def existing_index_names(table_name='doctor'):
+    """讀取資料表已存在的索引名稱"""
+    if db.engine.dialect.name == 'sqlite':
+        # SQLite 的 inspector 會略過運算式索引，直接查 sqlite_master
+        with db.engine.connect() as conn:
+            rows = conn.execute(
+                text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+                {'table': table_name}
+            )
+            return {row.name for row in rows}
+    return {index['name'] for index in inspect(db.engine).get_indexes(table_name)}
+
+def find_schema_drift():
+    """比對模型與資料庫，回傳 (缺少的欄位, 缺少的索引)"""
+    table = Doctor.__table__
+    columns = {col['name'] for col in inspect(db.engine).get_columns(table.name)}
+    missing_columns = [col.name for col in table.columns if col.name not in columns]
+    existing_indexes = existing_index_names(table.name)
+    missing_indexes = [index for index in table.indexes if index.name not in existing_indexes]
+    return missing_columns, missing_indexes
+
+def check_schema():
+    """啟動時檢查既有資料庫是否缺少欄位或索引（db.create_all() 不會替既有資料表補上）"""
+    missing_columns, missing_indexes = find_schema_drift()
+    if missing_columns:
+        print(f"⚠️ 資料庫缺少欄位: {', '.join(missing_columns)}，請執行 python upgrade_db.py")
+    if missing_indexes:
+        print(f"⚠️ 資料庫缺少索引: {', '.join(index.name for index in missing_indexes)}，請執行 python upgrade_db.py")
+    return not missing_columns and not missing_indexes
 
 def init_database():
     """初始化資料庫：只建立不存在的表，絕不刪除資料"""
     with app.app_context():
         try:
             db.create_all()
+            ensure_version(db.session)
+            db.session.commit()
+            check_schema()
+            print(f"搜尋引擎: {get_search_backend(db.engine).name}")
             print("資料庫初始化完成")
         except Exception as e:
             print(f"資料庫初始化錯誤: {e}")
@@ -377,7 +995,10 @@ if __name__ == '__main__':
     with app.app_context():
         try:
             db.create_all()  # ✅ 只建立表格結構,不會清空數據
+            ensure_version(db.session)
+            db.session.commit()
             print("數據庫表已創建")
+            check_schema()
         except Exception as e:
             print(f"數據庫初始化錯誤: {e}")
             db.create_all()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Excel 匯出效能測試：比較一般模式（export_doctors_to_excel）與串流模式（stream_doctors_to_excel）
+
+用法：
+    python bench_export.py                         # 10k、100k、500k 筆
+    python bench_export.py --sizes 10000 50000
+
+每個組合都在獨立的子行程中執行，才能各自量到峰值記憶體（RSS）。
+資料以產生器逐筆提供，不佔用額外記憶體，量到的就是匯出本身的成本。
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+from export import EXPORT_COLUMNS
+
+ExportRow = namedtuple('ExportRow', EXPORT_COLUMNS)
+
+STATUSES = ['已簽約', '合作過', '聯繫過', '有經紀', '未聯繫']
+SPECIALTIES = ['內科', '外科', '小兒科', '皮膚科', '家醫科', '婦產科']
+
+
+def generate_rows(count):
+    """逐筆產生測試資料"""
+    for i in range(count):
+        yield ExportRow(
+            name=f'醫師{i}',
+            email=f'doctor{i}@example.com',
+            specialty=SPECIALTIES[i % len(SPECIALTIES)],
+            gender='男' if i % 2 else '女',
+            status=STATUSES[i % len(STATUSES)],
+            contact_person='Nathan',
+            current_brand='品牌A、品牌B',
+            price_range=f'{(i % 50 + 1) * 10000:,}(議)',
+            has_social_media='是' if i % 3 else '否',
+            social_media_link=f'https://www.instagram.com/doctor{i}'
+        )
+
+
+def run_single(mode, rows):
+    """子行程：執行一次匯出並回報耗時與峰值記憶體"""
+    from export import export_doctors_to_excel, stream_doctors_to_excel
+    export = stream_doctors_to_excel if mode == 'stream' else export_doctors_to_excel
+
+    start = time.perf_counter()
+    file_path = export(generate_rows(rows))
+    elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(file_path)
+    os.remove(file_path)
+    # Linux 的 ru_maxrss 單位是 KB
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({'elapsed': elapsed, 'peak_rss_mb': peak_rss_mb, 'file_mb': size / 1024 / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Excel 匯出效能測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 500000], help='測試筆數')
+    parser.add_argument('--modes', nargs='+', default=['classic', 'stream'], choices=['classic', 'stream'])
+    parser.add_argument('--single', nargs=2, metavar=('MODE', 'ROWS'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single[0], int(args.single[1]))
+        return
+
+    print(f"{'模式':<10}{'筆數':>10}{'rows/sec':>12}{'峰值RSS(MB)':>14}{'檔案(MB)':>10}")
+    for rows in args.sizes:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, __file__, '--single', mode, str(rows)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<10}{rows:>10}{rows / result['elapsed']:>12.0f}"
+                  f"{result['peak_rss_mb']:>14.1f}{result['file_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
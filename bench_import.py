@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Excel 匯入效能測試
+
+用法：
+    python bench_import.py                          # 1k、10k、100k 筆，暫存 SQLite
+    python bench_import.py --sizes 1000 5000
+    DATABASE_URL=postgresql://... python bench_import.py   # 寫入指定資料庫（醫師名稱帶有唯一前綴，不會與既有資料衝突）
+
+產生與匯出格式相同的 Excel 檔，呼叫 import_doctors_from_excel 匯入，回報每秒匯入筆數。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from openpyxl import Workbook
+
+from export import HEADERS
+
+STATUSES = ['已簽約', '合作過', '聯繫過', '有經紀', '未聯繫']
+SPECIALTIES = ['內科', '外科', '小兒科', '皮膚科', '家醫科', '婦產科']
+
+
+def generate_workbook(path, rows, prefix):
+    """產生測試用的匯入檔（欄位順序與匯出檔相同）"""
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet('醫師資料')
+    sheet.append(HEADERS)
+    for i in range(rows):
+        sheet.append([
+            f'{prefix}醫師{i}',
+            SPECIALTIES[i % len(SPECIALTIES)],
+            '男' if i % 2 else '女',
+            STATUSES[i % len(STATUSES)],
+            'Nathan',
+            '品牌A',
+            f'{(i % 50 + 1) * 10000:,}(議)',
+            '是' if i % 3 else '否',
+            f'https://www.instagram.com/doctor{i}',
+        ])
+    wb.save(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Excel 匯入效能測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help='測試筆數')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench_import.db')
+
+    from app import app, db, Doctor
+    from import_data import import_doctors_from_excel
+
+    with app.app_context():
+        db.create_all()
+        print(f"資料庫: {db.engine.dialect.name}")
+        print(f"{'筆數':>10}{'檔案(MB)':>10}{'耗時(s)':>10}{'rows/sec':>12}{'錯誤':>8}")
+        for rows in args.sizes:
+            prefix = uuid.uuid4().hex[:8]
+            path = os.path.join(workdir, f'import_{rows}.xlsx')
+            generate_workbook(path, rows, prefix)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+
+            start = time.perf_counter()
+            result = import_doctors_from_excel(path, db, Doctor)
+            elapsed = time.perf_counter() - start
+
+            if not result['success']:
+                print(f"{rows:>10} 匯入失敗：{result['errors'][:1]}")
+                continue
+            print(f"{rows:>10}{size_mb:>10.1f}{elapsed:>10.2f}"
+                  f"{result['success_count'] / elapsed:>12.0f}{len(result['errors']):>8}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
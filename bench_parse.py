@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+匯入解析效能測試：比較舊的逐格解析（values_only=False + get_cell_value 閉包）與欄位計畫解析
+
+用法：
+    python bench_parse.py                 # 10 萬筆
+    python bench_parse.py --rows 20000
+
+不寫入資料庫，輸出每列平均耗時（微秒）：
+- 端到端：openpyxl 讀檔 + 轉換（讀檔的 XML 解析佔大部分，且波動大）
+- 只轉換：資料列先讀進記憶體（舊版是 Cell 物件、新版是值的 tuple），只量轉換本身，取多次中最快的一次
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+from bench_import import generate_workbook
+from export import HEADERS
+from import_data import make_row_parser
+
+
+def legacy_parse(rows, column_map):
+    """舊版解析迴圈（保留原本的邏輯作為比較基準）；rows 是 Cell 物件的 tuple"""
+    parsed = 0
+    for row_num, row in enumerate(rows, start=2):
+        if not any(cell.value for cell in row):
+            continue
+
+        def get_cell_value(header_name, default_idx=None):
+            idx = column_map.get(header_name, default_idx)
+            if idx is None:
+                return ''
+            if idx < len(row) and row[idx].value is not None:
+                value = row[idx].value
+                if isinstance(value, (int, float)):
+                    if isinstance(value, float) and value.is_integer():
+                        return str(int(value))
+                    return str(value)
+                elif isinstance(value, datetime):
+                    return value.strftime('%Y-%m-%d %H:%M:%S')
+                else:
+                    return str(value).strip()
+            return ''
+
+        doctor_field = get_cell_value('醫師', 0).strip() if get_cell_value('醫師', 0) else ''
+        if not doctor_field:
+            continue
+        specialty = get_cell_value('科別', 1).strip() if get_cell_value('科別', 1) else None
+        gender = get_cell_value('性別', 2).strip() if get_cell_value('性別', 2) else None
+        status = get_cell_value('狀態', 3).strip() if get_cell_value('狀態', 3) else None
+        contact_person = get_cell_value('聯絡窗口', 4).strip() if get_cell_value('聯絡窗口', 4) else None
+        current_brand = get_cell_value('合作品牌', 5).strip() if get_cell_value('合作品牌', 5) else None
+        price_range = get_cell_value('報價區間', 6).strip() if get_cell_value('報價區間', 6) else None
+        has_social_media = get_cell_value('經營社群', 7).strip() if get_cell_value('經營社群', 7) else None
+        social_media_link = get_cell_value('醫師社群', 8).strip() if get_cell_value('醫師社群', 8) else None
+        parsed += 1
+    return parsed
+
+
+def planned_parse(rows, column_map):
+    """新版解析：一次建立的欄位計畫；rows 是值的 tuple（values_only=True）"""
+    parse_row = make_row_parser(column_map)
+    parsed = 0
+    for row in rows:
+        if not any(row):
+            continue
+        fields = parse_row(row)
+        if not fields['name']:
+            continue
+        parsed += 1
+    return parsed
+
+
+PARSERS = (
+    ('legacy', legacy_parse, False),
+    ('planned', planned_parse, True),
+)
+
+
+def read_rows(path, values_only):
+    wb = load_workbook(path, data_only=True, read_only=True)
+    return wb, wb.active.iter_rows(min_row=2, values_only=values_only)
+
+
+def measure_end_to_end(path, parse, values_only, column_map):
+    start = time.perf_counter()
+    wb, rows = read_rows(path, values_only)
+    parsed = parse(rows, column_map)
+    elapsed = time.perf_counter() - start
+    wb.close()
+    return parsed, elapsed
+
+
+def measure_parse_only(path, parse, values_only, column_map, repeat):
+    wb, rows = read_rows(path, values_only)
+    rows = list(rows)
+    wb.close()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parsed = parse(rows, column_map)
+        timings.append(time.perf_counter() - start)
+    return parsed, min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='匯入解析效能測試')
+    parser.add_argument('--rows', type=int, default=100000, help='測試筆數')
+    parser.add_argument('--repeat', type=int, default=3, help='只轉換的重複次數（取最快）')
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'parse.xlsx')
+    print(f"產生 {args.rows} 筆測試檔...")
+    generate_workbook(path, args.rows, 'bench')
+    column_map = {header: idx for idx, header in enumerate(HEADERS)}
+
+    print(f"{'解析方式':<12}{'量測':<10}{'耗時(s)':>10}{'每列(µs)':>12}{'rows/sec':>12}")
+    for label, parse, values_only in PARSERS:
+        for scope, parsed, elapsed in (
+            ('端到端', *measure_end_to_end(path, parse, values_only, column_map)),
+            ('只轉換', *measure_parse_only(path, parse, values_only, column_map, args.repeat)),
+        ):
+            assert parsed == args.rows, (label, parsed)
+            print(f"{label:<12}{scope:<10}{elapsed:>10.2f}{elapsed / parsed * 1e6:>12.2f}{parsed / elapsed:>12.0f}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
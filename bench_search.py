@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+搜尋效能測試：比較 LIKE '%q%'（原本的 contains）與索引搜尋引擎
+
+用法：
+    python bench_search.py                      # 暫存 SQLite，10 萬筆，比較 like / fts5
+    python bench_search.py --rows 50000
+    DATABASE_URL=postgresql://... python bench_search.py   # 比較 like / pg_trgm（會寫入測試資料）
+
+輸出每個搜尋引擎在 /api/doctors?q=... 的平均、p50、p95 延遲（毫秒，含 JSON 序列化）。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+SURNAMES = '陳林黃張李王吳劉蔡楊許鄭謝洪郭邱曾廖賴徐周葉蘇莊呂江何蕭羅高潘簡朱鍾游彭詹胡施沈余盧梁趙顏柯翁魏'
+GIVEN = '志明俊傑家豪建宏冠宇承翰美玲淑芬雅婷怡君佳穎欣怡宗翰柏宇思妤品妍子涵宥廷詩涵'
+DOMAINS = ['gmail.com', 'yahoo.com.tw', 'hotmail.com', 'clinic.tw', 'hospital.org.tw']
+
+
+def make_rows(count, seed=42):
+    """產生測試用醫師資料"""
+    rnd = random.Random(seed)
+    rows = []
+    for i in range(count):
+        name = rnd.choice(SURNAMES) + rnd.choice(GIVEN) + rnd.choice(GIVEN)
+        email = f'doctor{i}.{rnd.randint(1000, 9999)}@{rnd.choice(DOMAINS)}'
+        rows.append({'name': f'{name}{i}', 'email': email, 'status': '未聯繫'})
+    return rows
+
+
+def seed_database(db, Doctor, count):
+    """資料筆數不足時補齊測試資料"""
+    existing = db.session.query(db.func.count(Doctor.id)).scalar()
+    if existing >= count:
+        return
+    rows = make_rows(count - existing, seed=existing)
+    for start in range(0, len(rows), 5000):
+        db.session.execute(db.insert(Doctor), rows[start:start + 5000])
+        db.session.commit()
+
+
+def pick_queries(count, seed=7):
+    """從測試資料的組成挑出搜尋關鍵字（含命中與未命中）"""
+    rnd = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        kind = rnd.random()
+        if kind < 0.4:
+            queries.append(rnd.choice(SURNAMES) + rnd.choice(GIVEN) + rnd.choice(GIVEN))
+        elif kind < 0.7:
+            queries.append(f'doctor{rnd.randint(0, 99999)}')
+        elif kind < 0.9:
+            queries.append(rnd.choice(DOMAINS).split('.')[0])
+        else:
+            queries.append('不存在的醫師')
+    return queries
+
+
+def measure(client, queries):
+    timings = []
+    for q in queries:
+        start = time.perf_counter()
+        response = client.get('/api/doctors', query_string={'q': q, 'limit': 100})
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, response.data
+    timings.sort()
+    return {
+        'mean': statistics.mean(timings),
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='搜尋效能測試')
+    parser.add_argument('--rows', type=int, default=100000, help='測試資料筆數')
+    parser.add_argument('--queries', type=int, default=200, help='每個搜尋引擎執行的查詢數')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_search.db')
+
+    from app import app, db, Doctor
+    import search
+
+    with app.app_context():
+        db.create_all()
+        print(f"準備 {args.rows} 筆測試資料...")
+        seed_database(db, Doctor, args.rows)
+
+        dialect = db.engine.dialect.name
+        indexed = search.TrigramSearch() if dialect == 'postgresql' else search.Fts5Search()
+        indexed.setup(db.engine)
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+
+    queries = pick_queries(args.queries)
+    print(f"資料庫: {dialect}，查詢數: {len(queries)}")
+    print(f"{'引擎':<10}{'平均(ms)':>12}{'p50(ms)':>12}{'p95(ms)':>12}")
+    for backend in (search.LikeSearch(), indexed):
+        search._backend = backend
+        measure(client, queries[:10])  # 暖機
+        result = measure(client, queries)
+        print(f"{backend.name:<10}{result['mean']:>12.2f}{result['p50']:>12.2f}{result['p95']:>12.2f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+醫師列表序列化效能測試：比較 to_dict() + jsonify 與欄位投影序列化（物件 / columns 格式）
+
+用法：
+    python bench_serialize.py                  # 500（單頁上限）與 10000 筆
+    python bench_serialize.py --sizes 100 50000
+
+不查詢資料庫：to_dict 路徑使用未存檔的 Doctor 物件，投影路徑使用相同內容的 tuple，
+只量序列化本身（取多次中最快的一次），並回報回應大小。有安裝 orjson 時投影路徑會使用 orjson。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+STATUSES = ['已簽約', '合作過', '聯繫過', '有經紀', '未聯繫']
+SPECIALTIES = ['內科', '外科', '小兒科', '皮膚科', '家醫科', '婦產科']
+
+
+def make_values(count):
+    """產生測試資料（欄位順序與 serialize.LIST_COLUMNS 相同）"""
+    base = datetime(2026, 1, 1, 9, 30, 15, 123456)
+    rows = []
+    for i in range(count):
+        rows.append((
+            i + 1, f'醫師{i}', f'醫師{i}', SPECIALTIES[i % len(SPECIALTIES)], '男' if i % 2 else '女',
+            STATUSES[i % len(STATUSES)], 'Nathan', '是' if i % 3 else '否',
+            f'https://www.instagram.com/doctor{i}', '品牌A、品牌B', f'{(i % 50 + 1) * 10000:,}(議)',
+            base + timedelta(minutes=i), base + timedelta(minutes=i, seconds=30),
+        ))
+    return rows
+
+
+def best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='醫師列表序列化效能測試')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 10000], help='測試筆數')
+    parser.add_argument('--repeat', type=int, default=5, help='重複次數（取最快）')
+    args = parser.parse_args()
+
+    if 'DATABASE_URL' not in os.environ:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_serialize.db')
+
+    from app import app, Doctor
+    import serialize
+
+    print(f"JSON 編碼器: {'orjson' if serialize.orjson else 'json（標準函式庫）'}")
+    print(f"{'方式':<22}{'筆數':>8}{'耗時(ms)':>12}{'每列(µs)':>12}{'大小(KB)':>12}")
+    with app.app_context():
+        for count in args.sizes:
+            values = make_values(count)
+            doctors = [Doctor(**dict(zip(serialize.LIST_COLUMNS, row))) for row in values]
+
+            paths = (
+                ('to_dict + jsonify', lambda: app.json.response(
+                    {'doctors': [doctor.to_dict() for doctor in doctors], 'next_cursor': None}).get_data()),
+                ('projection objects', lambda: serialize.dumps(
+                    {'doctors': serialize.rows_to_objects(values), 'next_cursor': None})),
+                ('projection columns', lambda: serialize.dumps(
+                    {**serialize.rows_to_columns(values), 'next_cursor': None})),
+            )
+            for label, fn in paths:
+                elapsed, body = best_of(fn, args.repeat)
+                print(f"{label:<22}{count:>8}{elapsed * 1000:>12.2f}{elapsed / count * 1e6:>12.2f}"
+                      f"{len(body) / 1024:>12.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
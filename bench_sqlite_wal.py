@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+SQLite PRAGMA 效能測試：匯入進行中時 /api/doctors 的讀取延遲（有無 WAL 等 PRAGMA）
+
+用法：
+    python bench_sqlite_wal.py                 # 匯入 1 萬筆
+    python bench_sqlite_wal.py --rows 50000
+
+每種設定（SQLITE_PRAGMAS=0 / 1）各用一個新的 SQLite 檔案，在獨立的子行程中執行：
+另一個行程匯入 Excel，這個行程持續呼叫 /api/doctors，統計匯入期間的讀取延遲與失敗次數。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench_import import generate_workbook
+
+
+def run_import(path):
+    """匯入子行程（環境變數已由父行程設定）"""
+    from app import app, db, Doctor
+    from import_data import import_doctors_from_excel
+    with app.app_context():
+        result = import_doctors_from_excel(path, db, Doctor)
+    if not result['success']:
+        raise SystemExit(result['errors'][:1])
+
+
+def run_single(rows):
+    """子行程：準備資料庫，啟動匯入行程，匯入期間持續讀取"""
+    from app import app, db, Doctor
+
+    with app.app_context():
+        db.create_all()
+        journal_mode = db.session.execute(db.text('PRAGMA journal_mode')).scalar()
+
+    path = os.path.join(os.path.dirname(os.environ['DATABASE_URL'][len('sqlite:///'):]), 'wal.xlsx')
+    generate_workbook(path, rows, 'wal')
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['logged_in'] = True
+
+    importer = multiprocessing.get_context('spawn').Process(target=run_import, args=(path,))
+    importer.start()
+    timings = []
+    failures = 0
+    start = time.perf_counter()
+    while importer.is_alive():
+        begin = time.perf_counter()
+        response = client.get('/api/doctors', query_string={'limit': 100, 'sort': 'name'})
+        if response.status_code == 200:
+            timings.append((time.perf_counter() - begin) * 1000)
+        else:
+            failures += 1
+    elapsed = time.perf_counter() - start
+    importer.join()
+
+    with app.app_context():
+        imported = db.session.query(db.func.count(Doctor.id)).scalar()
+    timings.sort()
+    if not timings:
+        timings = [0.0]
+    print(json.dumps({
+        'journal_mode': journal_mode,
+        'import_seconds': elapsed,
+        'imported': imported,
+        'reads': len(timings),
+        'failures': failures,
+        'p50': timings[len(timings) // 2],
+        'p95': timings[int(len(timings) * 0.95)],
+        'max': timings[-1],
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite PRAGMA 效能測試')
+    parser.add_argument('--rows', type=int, default=10000, help='匯入筆數')
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single:
+        run_single(args.single)
+        return
+
+    print(f"{'PRAGMA':<8}{'journal':>9}{'匯入筆數':>10}{'匯入(s)':>9}{'讀取次數':>10}{'失敗':>6}"
+          f"{'p50(ms)':>10}{'p95(ms)':>10}{'max(ms)':>10}")
+    for enabled in ('0', '1'):
+        env = dict(os.environ, SQLITE_PRAGMAS=enabled,
+                   DATABASE_URL='sqlite:///' + os.path.join(tempfile.mkdtemp(), 'wal.db'))
+        output = subprocess.run(
+            [sys.executable, __file__, '--single', str(args.rows)],
+            env=env, check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{'on' if enabled == '1' else 'off':<8}{result['journal_mode']:>9}{result['imported']:>10}{result['import_seconds']:>9.1f}"
+              f"{result['reads']:>10}{result['failures']:>6}{result['p50']:>10.1f}{result['p95']:>10.1f}"
+              f"{result['max']:>10.1f}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,47 @@
+"""
+醫師資料的變更紀錄（增量同步）
+
+GET /api/doctors/changes?since=<token> 回傳 token 之後新增或修改的醫師（依 updated_at 索引查詢），
+以及被刪除或不再符合篩選條件的 id（刪除記在 doctor_deletion 資料表）。瀏覽器用結果直接更新目前的列表，
+不必重新下載整份資料；沒有 since 時只回傳目前的 token。
+
+token 是伺服器的時間點。寫入的 updated_at 在 commit 之前就已決定，慢的交易可能在 token 之後才 commit，
+各 worker（或機器）的時鐘也可能略有差距，因此查詢時往前多看 CHANGES_OVERLAP_SECONDS 秒，
+重複回傳的資料由瀏覽器覆蓋即可。
+
+    CHANGES_OVERLAP_SECONDS  往前重疊的秒數（預設 5）
+    CHANGES_MAX_ROWS         一次最多回傳幾筆，超過時要求瀏覽器重新載入列表（預設 500）
+    CHANGES_RETENTION_DAYS   刪除紀錄保存天數，token 比這更舊時要求重新載入（預設 7）
+"""
+import base64
+import os
+from datetime import datetime, timedelta
+
+CHANGES_OVERLAP = timedelta(seconds=int(os.environ.get('CHANGES_OVERLAP_SECONDS', 5)))
+CHANGES_MAX_ROWS = int(os.environ.get('CHANGES_MAX_ROWS', 500))
+CHANGES_RETENTION = timedelta(days=int(os.environ.get('CHANGES_RETENTION_DAYS', 7)))
+
+
+def encode_token(moment):
+    """把時間點編成不透明的 token 字串"""
+    return base64.urlsafe_b64encode(moment.isoformat().encode('ascii')).decode('ascii').rstrip('=')
+
+
+def decode_token(token):
+    """解析 token，回傳時間點；沒有 token 時回傳 None，格式錯誤時丟出 ValueError"""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode('ascii')).decode('ascii'))
+    except (ValueError, UnicodeError):
+        raise ValueError('since 格式錯誤')
+
+
+def window_start(since, now):
+    """
+    回傳查詢變更的起點；token 超過保存期限時回傳 None（刪除紀錄可能已被清除，需整份重新載入）
+    """
+    if now - since > CHANGES_RETENTION:
+        return None
+    return since - CHANGES_OVERLAP
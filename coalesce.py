@@ -0,0 +1,69 @@
+"""
+相同請求合併（single flight）
+
+多人同時開著儀表板、或打字很快時，常會有多個參數完全相同的查詢同時在執行。
+SingleFlight 讓同一個鍵同時只執行一次：第一個請求（leader）實際查詢資料庫，
+其他同鍵的請求等待並共用 leader 的結果（包含例外）。
+只在同一個程序內有效（gthread 等多執行緒 worker）；不同 worker 之間不會合併。
+"""
+import threading
+
+from werkzeug.datastructures import MultiDict
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """執行 fn() 並回傳 (結果, 是否共用了其他請求的結果)"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+def clean_args(args):
+    """
+    去掉參數值前後的空白並略過空值，回傳新的 MultiDict
+
+    查詢、排序與快取鍵（normalize_args）都要用同一份整理過的參數，
+    否則「內科 」與「內科」會共用快取，實際查詢卻不同。
+    """
+    return MultiDict([(name, value.strip()) for name, values in args.lists()
+                      for value in values if value.strip()])
+
+
+def normalize_args(args, ignore=()):
+    """把查詢參數轉成可當作鍵的 tuple：忽略空值，同名參數（例如多選科別）不分順序"""
+    items = []
+    for name, values in clean_args(args).lists():
+        if name not in ignore:
+            items.append((name, tuple(sorted(values))))
+    return tuple(sorted(items))
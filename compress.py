@@ -0,0 +1,101 @@
+"""
+回應壓縮（gzip / brotli）
+
+依 Accept-Encoding 協商：有安裝 brotli 且瀏覽器支援時用 br，否則用 gzip。
+一般回應小於 COMPRESS_MIN_SIZE 位元組時不壓縮；串流回應（CSV / NDJSON 匯出）逐塊壓縮並立即送出，
+不必等整份資料產生完。send_file 的檔案（xlsx 本身已經是壓縮檔）不處理。
+"""
+import os
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # brotli 是選用套件，沒安裝時只提供 gzip
+    brotli = None
+
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+COMPRESS_LEVEL = 6  # gzip 壓縮等級
+BROTLI_QUALITY = 5  # 動態內容用中等品質，壓縮率與速度較平衡
+
+COMPRESS_MIMETYPES = {
+    'application/json', 'application/x-ndjson', 'text/csv',
+    'text/html', 'text/plain', 'text/css', 'application/javascript',
+}
+
+
+def choose_encoding(accept_encodings):
+    """依請求的 Accept-Encoding 選擇壓縮方式；都不接受時回傳 None"""
+    if brotli is not None and accept_encodings.quality('br') > 0:
+        return 'br'
+    if accept_encodings.quality('gzip') > 0:
+        return 'gzip'
+    return None
+
+
+def compress_bytes(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # wbits=31：gzip 格式
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding):
+    """逐塊壓縮；每塊都 flush，瀏覽器可以邊收邊解壓"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        process, flush, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)
+        process = compressor.compress
+        flush = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+        finish = compressor.flush
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        # 連線中斷時也要關閉原本的產生器（釋放資料庫游標）
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    """after_request：壓縮可壓縮的回應"""
+    if request.method == 'HEAD' or response.status_code != 200:
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+    if response.mimetype not in COMPRESS_MIMETYPES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return response
+        response.set_data(compress_bytes(data, encoding))
+
+    response.headers['Content-Encoding'] = encoding
+    # 壓縮後的內容與原本位元組不同，強 ETag 改為弱 ETag（If-None-Match 以弱比對驗證）
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
@@ -0,0 +1,117 @@
+"""
+資料庫連線池設定
+
+Render 會切斷閒置的 PostgreSQL 連線，預設連線池沒有 pre-ping，閒置一段時間後的第一個請求會失敗或卡住。
+這裡依環境變數產生 SQLALCHEMY_ENGINE_OPTIONS，預設值依 gunicorn 每個 worker 的執行緒數設定：
+
+    DB_POOL_SIZE            常駐連線數（預設為 GUNICORN_THREADS + 1，多的一條給背景匯入）
+    DB_MAX_OVERFLOW         尖峰時可額外開的連線數（預設 2）
+    DB_POOL_TIMEOUT         等待可用連線的秒數（預設 10）
+    DB_POOL_RECYCLE         連線使用超過幾秒就重建（預設 280，小於常見的 5 分鐘閒置切斷）
+    DB_POOL_PRE_PING        取出連線前先確認連線仍有效（預設 1）
+    DB_STATEMENT_TIMEOUT_MS 單一 SQL 的執行時間上限（毫秒，預設 30000，0 表示不限制）
+
+總連線數約為 worker 數 ×（DB_POOL_SIZE + DB_MAX_OVERFLOW），需小於資料庫的連線上限。
+SQLite 不需要這些設定。
+
+匯出會讀完整個資料表，比一般路由需要更長的 SQL 執行時間，另外用
+EXPORT_STATEMENT_TIMEOUT_MS（預設 300000）在該請求的交易中以 SET LOCAL 放寬。
+
+SQLite（本地預設的 sqlite:///doctors.db）在每條新連線套用 PRAGMA（SQLITE_PRAGMAS=0 可關閉）：
+
+    journal_mode=WAL        讀取不會被寫入（匯入的 commit）擋住
+    synchronous=NORMAL      WAL 模式下安全，commit 不必每次 fsync
+    cache_size              頁面快取（SQLITE_CACHE_SIZE_KB，預設 65536 KB）
+    mmap_size               記憶體映射讀取（SQLITE_MMAP_SIZE，預設 256 MB）
+    busy_timeout            遇到寫入鎖時等待的毫秒數（SQLITE_BUSY_TIMEOUT_MS，預設 5000）
+"""
+import os
+import sqlite3
+
+from flask import request
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def engine_options(database_uri):
+    """依資料庫種類回傳 SQLAlchemy create_engine 的參數"""
+    if not database_uri.startswith('postgresql'):
+        return {}
+
+    threads = _env_int('GUNICORN_THREADS', 4)
+    options = {
+        'pool_size': _env_int('DB_POOL_SIZE', threads + 1),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 2),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 10),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 280),
+        'pool_pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') not in ('0', 'false', 'False'),
+    }
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+    if statement_timeout > 0:
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+
+def pool_status(engine):
+    """連線池狀態（給 /healthz 使用）；不是 QueuePool 時只回傳類別名稱"""
+    pool = engine.pool
+    status = {'class': type(pool).__name__}
+    for name in ('size', 'checkedin', 'checkedout', 'overflow'):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
+
+# 需要不同 SQL 執行時間上限的路由（endpoint 名稱 -> 毫秒）
+ROUTE_STATEMENT_TIMEOUTS_MS = {
+    'export_excel': _env_int('EXPORT_STATEMENT_TIMEOUT_MS', 300000),
+    'export_csv': _env_int('EXPORT_STATEMENT_TIMEOUT_MS', 300000),
+    'export_ndjson': _env_int('EXPORT_STATEMENT_TIMEOUT_MS', 300000),
+}
+
+
+def init_route_timeouts(app, db):
+    """請求開始時，依路由在本次交易設定 statement_timeout（只對 PostgreSQL 有效）"""
+
+    @app.before_request
+    def set_route_statement_timeout():
+        timeout_ms = ROUTE_STATEMENT_TIMEOUTS_MS.get(request.endpoint)
+        if timeout_ms is None or db.engine.dialect.name != 'postgresql':
+            return
+        # SET LOCAL 只在目前交易內有效，請求結束 session 歸還連線時自動恢復連線的預設值
+        db.session.execute(text(f'SET LOCAL statement_timeout = {int(timeout_ms)}'))
+
+
+SQLITE_PRAGMAS_ENABLED = os.environ.get('SQLITE_PRAGMAS', '1') not in ('0', 'false', 'False')
+
+# 依序執行；busy_timeout 放最前面，切換 WAL 時遇到鎖也會等待
+SQLITE_PRAGMAS = (
+    ('busy_timeout', _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('cache_size', -_env_int('SQLITE_CACHE_SIZE_KB', 65536)),  # 負數代表以 KB 為單位
+    ('mmap_size', _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+)
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """connect 事件：新的 SQLite 連線套用 SQLITE_PRAGMAS"""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS:
+            cursor.execute(f'PRAGMA {name}={value}')
+    finally:
+        cursor.close()
+
+
+def init_sqlite_pragmas(enabled=SQLITE_PRAGMAS_ENABLED):
+    """註冊 SQLite 連線的 PRAGMA 設定（對所有 Engine 生效，非 SQLite 連線會略過）"""
+    if enabled and not event.contains(Engine, 'connect', set_sqlite_pragmas):
+        event.listen(Engine, 'connect', set_sqlite_pragmas)
@@ -0,0 +1,81 @@
+"""
+即時更新（Server-Sent Events）
+
+GET /api/events 保持連線，醫師資料有變動時推送：
+
+    event: changes   與 /api/doctors/changes 相同的內容（依連線時的篩選條件），id 為下一次的 token
+    event: stats     /api/stats 的統計數字
+
+是否有變動以資料庫的版本號（result_cache.read_version）判斷，每 SSE_POLL_SECONDS 秒讀一次，
+其他 worker 的寫入也看得到；同一個 worker 內的寫入透過 change_notifier 立即喚醒，不必等到下一次輪詢。
+瀏覽器斷線重連時會以 Last-Event-ID 帶回最後的 token，從該處繼續。
+
+每條 SSE 連線在整段期間佔用一個 worker 執行緒（gthread），因此每個 worker 同時最多 SSE_MAX_STREAMS 條，
+且至少留一個執行緒處理一般請求（上限依 gunicorn.conf.py 讀取的 GUNICORN_WORKER_CLASS、GUNICORN_THREADS 計算）。
+sync worker 一次只處理一個請求，一條連線就會卡住整個 worker，因此不開放即時更新。
+超過上限時回 503，前端改用定期輪詢；連線超過 SSE_MAX_SECONDS 秒由伺服器結束，瀏覽器自動重連，
+讓執行緒有機會輪替。使用 gevent worker 時可以調高 SSE_MAX_STREAMS。
+
+    SSE_POLL_SECONDS   讀取版本號的間隔（預設 2）
+    SSE_MAX_STREAMS    每個 worker 的連線上限（預設 2）
+    SSE_MAX_SECONDS    單一連線的最長時間（預設 300）
+"""
+import json
+import os
+import threading
+
+SSE_POLL_SECONDS = float(os.environ.get('SSE_POLL_SECONDS', 2))
+SSE_MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', 2))
+SSE_MAX_SECONDS = int(os.environ.get('SSE_MAX_SECONDS', 300))
+SSE_HEARTBEAT_SECONDS = 15  # 沒有事件時送出註解行，避免代理伺服器切斷閒置連線
+SSE_RETRY_MS = 5000  # 斷線後瀏覽器等待多久重連
+
+
+def stream_limit(max_streams=SSE_MAX_STREAMS):
+    """依 worker 類型計算每個 worker 可開的 SSE 連線數；0 表示不開放"""
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').rsplit('.', 1)[-1].lower()
+    if worker_class in ('sync', 'syncworker'):
+        return 0
+    if worker_class in ('gthread', 'threadworker'):
+        threads = int(os.environ.get('GUNICORN_THREADS', 4))
+        return max(0, min(max_streams, threads - 1))
+    return max_streams  # gevent 等非同步 worker
+
+
+SSE_STREAM_LIMIT = stream_limit()
+
+
+class ChangeNotifier:
+    """同一個程序內的寫入通知：寫入後 notify()，SSE 連線以 wait() 等待"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._counter = 0
+
+    @property
+    def counter(self):
+        return self._counter
+
+    def notify(self):
+        with self._condition:
+            self._counter += 1
+            self._condition.notify_all()
+
+    def wait(self, seen, timeout):
+        """等到計數與 seen 不同或逾時，回傳目前的計數"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._counter != seen, timeout)
+            return self._counter
+
+
+change_notifier = ChangeNotifier()
+stream_slots = threading.BoundedSemaphore(SSE_STREAM_LIMIT) if SSE_STREAM_LIMIT else None
+
+
+def format_event(event, data, event_id=None):
+    """組成一則 SSE 訊息"""
+    lines = [f'event: {event}']
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
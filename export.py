@@ -1,84 +1,198 @@
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from datetime import datetime
+import csv
+import io
+import json
 import os
 
+# 設定標題列（簡化欄位，只保留必要資訊）
+# 匯出順序：醫師、科別、性別、狀態、聯絡窗口、合作品牌、報價區間、經營社群、醫師社群
+HEADERS = ['醫師', '科別', '性別', '狀態', '聯絡窗口', '合作品牌', '報價區間', '經營社群', '醫師社群']
+
+# 欄寬（按照欄位順序）
+COLUMN_WIDTHS = {
+    'A': 30,  # 醫師
+    'B': 12,  # 科別
+    'C': 8,   # 性別
+    'D': 12,  # 狀態
+    'E': 12,  # 聯絡窗口
+    'F': 20,  # 合作品牌
+    'G': 15,  # 報價區間
+    'H': 12,  # 經營社群
+    'I': 30   # 醫師社群
+}
+
+# 匯出時只需要讀取這些欄位（串流匯出用欄位查詢，不必建立完整的 ORM 物件）
+EXPORT_COLUMNS = ['name', 'email', 'specialty', 'gender', 'status', 'contact_person',
+                  'current_brand', 'price_range', 'has_social_media', 'social_media_link']
+
+
+def doctor_row(doctor):
+    """把一筆醫師資料轉成匯出列（優先使用 email，沒有就用 name）"""
+    return [
+        doctor.email or doctor.name or '',  # 醫師：優先使用 email，沒有就用 name
+        doctor.specialty or '',  # 科別
+        doctor.gender or '',  # 性別
+        doctor.status or '',  # 狀態
+        doctor.contact_person or '',  # 聯絡窗口
+        doctor.current_brand or '',  # 合作品牌
+        doctor.price_range or '',  # 報價區間
+        doctor.has_social_media or '',  # 經營社群
+        doctor.social_media_link or ''  # 醫師社群
+    ]
+
+
+def _thin_border():
+    side = Side(style='thin')
+    return Border(left=side, right=side, top=side, bottom=side)
+
+
+def _export_file_path():
+    return f'/tmp/doctors_export_{datetime.now().strftime("%Y%m%d_%H%M%S_%f")}.xlsx'
+
+
 def export_doctors_to_excel(doctors):
-    """匯出醫師資料到 Excel"""
+    """匯出醫師資料到 Excel（一般模式：整本活頁簿留在記憶體，寫完再逐格套用樣式）"""
     wb = Workbook()
     sheet = wb.active
     sheet.title = "醫師資料"
-    
-    # 設定標題列（簡化欄位，只保留必要資訊）
-    # 匯出順序：醫師、科別、性別、狀態、聯絡窗口、合作品牌、報價區間、經營社群、醫師社群
-    headers = ['醫師', '科別', '性別', '狀態', '聯絡窗口', '合作品牌', '報價區間', '經營社群', '醫師社群']
-    sheet.append(headers)
-    
+
+    sheet.append(HEADERS)
+
     # 設定標題列樣式
     header_fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
     header_font = Font(bold=True, color='FFFFFF', size=12)
-    
-    for col_num, header in enumerate(headers, 1):
+
+    for col_num, header in enumerate(HEADERS, 1):
         cell = sheet.cell(row=1, column=col_num)
         cell.fill = header_fill
         cell.font = header_font
         cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # 寫入資料（優先使用 email，沒有就用 name）
-    for index, doctor in enumerate(doctors, 1):
-        doctor_name = doctor.name or ''
-        doctor_email = doctor.email or ''
-        # 醫師欄位：優先顯示 email，沒有就用 name
-        doctor_field = doctor_email or doctor_name or ''
-        row_data = [
-            doctor_field,  # 醫師：優先使用 email，沒有就用 name
-            doctor.specialty or '',  # 科別
-            doctor.gender or '',  # 性別
-            doctor.status or '',  # 狀態
-            doctor.contact_person or '',  # 聯絡窗口
-            doctor.current_brand or '',  # 合作品牌
-            doctor.price_range or '',  # 報價區間
-            doctor.has_social_media or '',  # 經營社群
-            doctor.social_media_link or ''  # 醫師社群
-        ]
-        sheet.append(row_data)
-    
-    # 調整欄寬（按照新的欄位順序）
-    column_widths = {
-        'A': 30,  # 醫師
-        'B': 12,  # 科別
-        'C': 8,   # 性別
-        'D': 12,  # 狀態
-        'E': 12,  # 聯絡窗口
-        'F': 20,  # 合作品牌
-        'G': 15,  # 報價區間
-        'H': 12,  # 經營社群
-        'I': 30   # 醫師社群
-    }
-    
-    for col, width in column_widths.items():
+
+    # 寫入資料
+    for doctor in doctors:
+        sheet.append(doctor_row(doctor))
+
+    for col, width in COLUMN_WIDTHS.items():
         sheet.column_dimensions[col].width = width
-    
+
     # 設定資料列樣式
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-    
-    for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row, min_col=1, max_col=len(headers)):
+    thin_border = _thin_border()
+
+    for row in sheet.iter_rows(min_row=1, max_row=sheet.max_row, min_col=1, max_col=len(HEADERS)):
         for cell in row:
             cell.border = thin_border
             if cell.row > 1:  # 資料列
                 cell.alignment = Alignment(horizontal='left', vertical='center')
-    
+
     # 凍結首列
     sheet.freeze_panes = 'A2'
-    
+
     # 儲存檔案（確保UTF-8編碼支持）
-    file_path = f'/tmp/doctors_export_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx'
+    file_path = _export_file_path()
     # openpyxl 自動處理 UTF-8 編碼，無需額外設置
     wb.save(file_path)
-    
+
+    return file_path
+
+
+def stream_doctors_to_excel(doctors):
+    """
+    匯出醫師資料到 Excel（串流模式）
+
+    使用 openpyxl 的 write_only 活頁簿：每一列寫入後立即序列化到暫存檔，
+    樣式使用共用的具名樣式，不會為每個儲存格建立樣式物件，
+    因此記憶體用量與資料筆數無關。doctors 可以是 yield_per 的查詢結果。
+    """
+    wb = Workbook(write_only=True)
+    sheet = wb.create_sheet("醫師資料")
+
+    thin_border = _thin_border()
+    wb.add_named_style(NamedStyle(
+        name='doctor_header',
+        font=Font(bold=True, color='FFFFFF', size=12),
+        fill=PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid'),
+        border=thin_border,
+        alignment=Alignment(horizontal='center', vertical='center')
+    ))
+    wb.add_named_style(NamedStyle(
+        name='doctor_body',
+        border=thin_border,
+        alignment=Alignment(horizontal='left', vertical='center')
+    ))
+
+    # write_only 模式下，欄寬與凍結窗格必須在寫入任何資料列之前設定
+    for col, width in COLUMN_WIDTHS.items():
+        sheet.column_dimensions[col].width = width
+    sheet.freeze_panes = 'A2'
+
+    def styled(values, style):
+        cells = []
+        for value in values:
+            cell = WriteOnlyCell(sheet, value=value)
+            cell.style = style
+            cells.append(cell)
+        return cells
+
+    sheet.append(styled(HEADERS, 'doctor_header'))
+    for doctor in doctors:
+        sheet.append(styled(doctor_row(doctor), 'doctor_body'))
+
+    file_path = _export_file_path()
+    wb.save(file_path)
     return file_path
+
+
+# CSV / NDJSON 串流匯出的欄位（給 BI 使用，保留原始欄位名稱與時間欄位）
+STREAM_COLUMNS = ['id', 'name', 'email', 'specialty', 'gender', 'status', 'contact_person',
+                  'has_social_media', 'social_media_link', 'current_brand', 'price_range',
+                  'price_min', 'price_max', 'created_at', 'updated_at']
+
+# 每累積這麼多列送出一次，減少 chunk 數量
+STREAM_CHUNK_ROWS = 500
+
+
+def _stream_value(value):
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    return value
+
+
+def iter_doctors_csv(rows):
+    """逐批產生 CSV 文字（第一個 chunk 是標題列，會立即送出）"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(STREAM_COLUMNS)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+
+    count = 0
+    for row in rows:
+        writer.writerow(['' if value is None else _stream_value(value) for value in row])
+        count += 1
+        if count % STREAM_CHUNK_ROWS == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_doctors_ndjson(rows):
+    """逐批產生 NDJSON（每行一筆 JSON 物件；第一筆讀到就立即送出）"""
+    lines = []
+    first = True
+    for row in rows:
+        record = {name: _stream_value(value) for name, value in zip(STREAM_COLUMNS, row)}
+        lines.append(json.dumps(record, ensure_ascii=False))
+        if first or len(lines) >= STREAM_CHUNK_ROWS:
+            first = False
+            yield '\n'.join(lines) + '\n'
+            lines = []
+
+    if lines:
+        yield '\n'.join(lines) + '\n'
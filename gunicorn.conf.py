@@ -0,0 +1,64 @@
+"""
+gunicorn 正式環境設定（gunicorn -c gunicorn.conf.py app:app）
+
+可用環境變數調整：
+    WEB_CONCURRENCY         worker 數（預設 CPU 數 × 2 + 1，最多 GUNICORN_MAX_WORKERS 個）
+    GUNICORN_MAX_WORKERS    自動計算時的 worker 上限（預設 4，免費方案記憶體有限）
+    GUNICORN_WORKER_CLASS   gthread（預設）、gevent（需另外安裝 gevent）或 sync
+    GUNICORN_THREADS        gthread 每個 worker 的執行緒數（預設 4，連線池大小也依此設定）
+    GUNICORN_TIMEOUT        worker 無回應多久後重啟（秒，預設 120，需涵蓋最慢的匯出）
+    GUNICORN_PRELOAD        是否在 master 先載入 app（預設 1）
+
+匯入在背景執行緒執行，不受請求逾時影響；匯出與其他路由的 SQL 執行時間上限見 db_config.py。
+即時更新（/api/events）每條連線佔用一個執行緒，每個 worker 的上限見 events.py 的 SSE_MAX_STREAMS。
+"""
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8080')}"
+
+_auto_workers = min(multiprocessing.cpu_count() * 2 + 1, int(os.environ.get('GUNICORN_MAX_WORKERS', 4)))
+workers = int(os.environ.get('WEB_CONCURRENCY', _auto_workers))
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+if worker_class == 'gevent':
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
+
+# 先在 master 載入 app，worker fork 後共用已載入的程式碼（啟動較快、記憶體較省）
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'False')
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """
+    master 啟動完成、開始 fork worker 之前：建立缺少的資料表並檢查欄位與索引
+
+    正式環境不會執行 python app.py，新版本加的資料表（data_version、doctor_deletion 等）在這裡建立；
+    既有資料表缺少的欄位或索引只印出警告，需執行 python upgrade_db.py（render.yaml 已在啟動前執行）。
+    """
+    from app import app, db, init_database
+    init_database()
+    # master 不處理請求，不需保留連線；fork 出去的 worker 各自重新連線
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def post_fork(server, worker):
+    """
+    fork 後捨棄從 master 繼承的連線池
+
+    master 在 when_ready 已經載入 app 並開過資料庫連線（不論是否 preload），子程序不能共用同一條連線；
+    close=False 只丟掉連線池的參照、不關閉連線本身，避免把 master（或其他 worker）的連線關掉。
+    """
+    from app import app, db
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
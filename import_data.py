@@ -2,11 +2,189 @@ from openpyxl import load_workbook
 from openpyxl.utils.exceptions import InvalidFileException
 from datetime import datetime
 import os
+from sqlalchemy import func, case
+from pricing import parse_price_range
+from result_cache import bump_version
 
-def import_doctors_from_excel(file_path, db, Doctor):
-    """從 Excel 文件匯入醫師資料（按照匯出格式）"""
+# 每批寫入的筆數：一次 executemany 送出整批，失敗時只針對這一批逐筆重試
+BULK_BATCH_SIZE = 1000
+
+# 匯入模式：skip 跳過已存在的醫師；upsert 以檔案內容更新已存在的醫師（依醫師名稱比對）
+IMPORT_MODES = ('skip', 'upsert')
+
+# upsert 時會更新的欄位（name 是比對鍵，status 另外處理）
+UPSERT_COLUMNS = ['email', 'specialty', 'gender', 'contact_person', 'has_social_media',
+                  'social_media_link', 'current_brand', 'price_range']
+
+
+def insert_rows(db, Doctor):
+    """回傳以 Core executemany 新增資料列的函數（回傳寫入的筆數）"""
+    table = Doctor.__table__
+
+    def execute(rows):
+        db.session.execute(table.insert(), rows)
+        return len(rows)
+
+    return execute
+
+
+def upsert_rows(db, Doctor):
+    """
+    回傳以 INSERT ... ON CONFLICT (name) DO UPDATE 寫入資料列的函數（PostgreSQL / SQLite）
+
+    依賴 ux_doctor_name 唯一索引。匯出的醫師欄位是 email（沒有才用 name），舊資料的 name 可能與 email 不同，
+    因此檔案中的值若等於某位醫師的 email、又沒有同名的醫師，改用該醫師的 name 比對，重新匯入匯出檔不會重複新增。
+    檔案中空白的欄位不會覆蓋既有值；
+    空白的狀態在新增時預設為「未聯繫」，更新時保留原狀態。
+    回傳的函數回傳實際寫入的醫師數（同一批中重複的名稱只算一次）。
+    """
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    table = Doctor.__table__
+
+    def statement(update_status):
+        stmt = insert(table)
+        excluded = stmt.excluded
+        set_ = {name: func.coalesce(excluded[name], table.c[name]) for name in UPSERT_COLUMNS}
+        # 報價數字跟著報價字串走：有新的報價字串才採用新解析的數字
+        for name in ('price_min', 'price_max'):
+            set_[name] = case((excluded.price_range.is_(None), table.c[name]), else_=excluded[name])
+        if update_status:
+            set_['status'] = excluded.status
+        set_['updated_at'] = datetime.utcnow()
+        return stmt.on_conflict_do_update(index_elements=[table.c.name], set_=set_)
+
+    def resolve_names(rows):
+        # 檔案中的值 -> 以 email 對應到的既有醫師 name（id 最小的優先）
+        keys = list({values['name'] for values in rows})
+        named = set(db.session.execute(
+            db.select(table.c.name).where(table.c.name.in_(keys))
+        ).scalars())
+        aliases = {}
+        for email, name in db.session.execute(
+            db.select(table.c.email, table.c.name)
+            .where(table.c.email.in_(keys), table.c.name != table.c.email)
+            .order_by(table.c.id)
+        ):
+            if email not in named:
+                aliases.setdefault(email, name)
+        return [{**values, 'name': aliases[values['name']]} if values['name'] in aliases else values
+                for values in rows]
+
+    def execute(rows):
+        rows = resolve_names(rows)
+        # 同一批中重複的醫師只保留最後一筆（同一個陳述式不能更新同一列兩次）
+        rows = list({values['name']: values for values in rows}.values())
+        with_status = [values for values in rows if values['status']]
+        without_status = [{**values, 'status': '未聯繫'} for values in rows if not values['status']]
+        if with_status:
+            db.session.execute(statement(update_status=True), with_status)
+        if without_status:
+            db.session.execute(statement(update_status=False), without_status)
+        return len(rows)
+
+    return execute
+
+
+def write_batch(db, pending_rows, errors, execute):
+    """
+    整批寫入一批資料，回傳成功筆數
+
+    整批寫入失敗時回滾，只針對這一批逐筆寫入，找出有問題的資料列。
+    """
+    try:
+        written = execute([values for _, values in pending_rows])
+        bump_version(db.session)
+        db.session.commit()
+        return written
+    except Exception as batch_error:
+        db.session.rollback()
+        first_row, last_row = pending_rows[0][0], pending_rows[-1][0]
+        errors.append(f"第 {first_row}–{last_row} 行批量寫入失敗，改為逐筆寫入：{str(batch_error)}")
+
+    written = 0
+    for row_num, values in pending_rows:
+        try:
+            count = execute([values])
+            bump_version(db.session)
+            db.session.commit()
+            written += count
+        except Exception as single_error:
+            db.session.rollback()
+            errors.append(f"第 {row_num} 行：醫師 '{values['email']}' 寫入失敗：{str(single_error)}")
+    return written
+
+# 匯入欄位：(資料欄位, 標題, 找不到標題時的預設欄位位置)，順序與匯出檔相同
+IMPORT_FIELDS = [
+    ('name', '醫師', 0),
+    ('specialty', '科別', 1),
+    ('gender', '性別', 2),
+    ('status', '狀態', 3),
+    ('contact_person', '聯絡窗口', 4),
+    ('current_brand', '合作品牌', 5),
+    ('price_range', '報價區間', 6),
+    ('has_social_media', '經營社群', 7),
+    ('social_media_link', '醫師社群', 8),
+]
+
+
+def _text(value):
+    return value.strip() or None
+
+
+def _number(value):
+    # 整數值的浮點數（Excel 的數字）不帶小數點
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _datetime(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S')
+
+
+# 依儲存格值的型別轉成文字；空白字串轉成 None
+CELL_CONVERTERS = {str: _text, int: _number, float: _number, bool: _number, datetime: _datetime}
+
+
+def convert_cell(value):
+    """把一個儲存格的值轉成匯入用的文字（空白為 None）"""
+    if value is None:
+        return None
+    converter = CELL_CONVERTERS.get(type(value))
+    if converter is None:
+        return str(value).strip() or None
+    return converter(value) or None
+
+
+def make_row_parser(column_map):
+    """
+    依標題對應（column_map）建立一次欄位計畫，回傳把一列值（tuple）轉成欄位 dict 的函數
+
+    每個欄位的位置只查一次；每個儲存格只讀取、轉換一次。
+    """
+    plan = [(field, column_map.get(header, default_idx)) for field, header, default_idx in IMPORT_FIELDS]
+
+    def parse_row(row):
+        width = len(row)
+        return {field: convert_cell(row[idx]) if idx is not None and idx < width else None
+                for field, idx in plan}
+
+    return parse_row
+
+
+def import_doctors_from_excel(file_path, db, Doctor, mode='skip', progress=None):
+    """
+    從 Excel 文件匯入醫師資料（按照匯出格式）；mode 為 skip（跳過已存在）或 upsert（更新已存在）
+
+    progress(rows_read, success_count, errors, total_rows) 會在每批寫入後呼叫，
+    讓背景匯入工作回報進度；total_rows 在檔案沒有記錄尺寸時為 None。
+    """
     errors = []
     success_count = 0
+    rows_read = 0
     
     try:
         # 檢查檔案是否存在
@@ -68,8 +246,9 @@ def import_doctors_from_excel(file_path, db, Doctor):
         
         sheet = wb.active
         
-        # 檢查工作表是否為空
-        if sheet.max_row < 2:
+        # 檢查工作表是否為空（write_only 產生的檔案（包含本系統的串流匯出）沒有記錄尺寸，
+        # max_row 會是 None，所以直接讀前兩列判斷）
+        if len(list(sheet.iter_rows(max_row=2, values_only=True))) < 2:
             wb.close()
             return {
                 'success': False,
@@ -159,127 +338,73 @@ def import_doctors_from_excel(file_path, db, Doctor):
                 'errors': [f'匯入失敗：Excel 檔案中缺少必要的欄位：{", ".join(missing_fields)}。請確認檔案格式正確。']
             }
         
-        # 預載所有已存在的 email 和 name，避免迴圈內 N+1 查詢
-        existing_emails = {d.email for d in Doctor.query.with_entities(Doctor.email).all() if d.email}
-        existing_names  = {d.name  for d in Doctor.query.with_entities(Doctor.name).all()  if d.name}
+        if mode == 'upsert':
+            # upsert 交給資料庫的 ON CONFLICT 比對，不需要把整個資料表載入記憶體
+            execute = upsert_rows(db, Doctor)
+            existing_emails = existing_names = None
+        else:
+            execute = insert_rows(db, Doctor)
+            # 預載所有已存在的 email 和 name，避免迴圈內 N+1 查詢
+            existing_emails = {d.email for d in Doctor.query.with_entities(Doctor.email).all() if d.email}
+            existing_names  = {d.name  for d in Doctor.query.with_entities(Doctor.name).all()  if d.name}
+
+        # 資料列數（不含標題列）；write_only 產生的檔案沒有記錄尺寸，無法預先得知
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+        if progress:
+            progress(0, 0, errors, total_rows)
 
         # 從第二行開始讀取資料
-        batch_size = 50  # 每批處理50筆資料
-        doctors_to_add = []
+        pending_rows = []  # 待寫入的資料列：(Excel 行號, 欄位 dict)
+
+        parse_row = make_row_parser(column_map)
 
-        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=False), start=2):
+        # values_only=True 直接取得值的 tuple，不建立 openpyxl 的 Cell 物件
+        for row_num, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+            rows_read = row_num - 1
             # 跳過空行
-            if not any(cell.value for cell in row):
+            if not any(row):
                 continue
             
             try:
-                # 提取資料的輔助函數
-                def get_cell_value(header_name, default_idx=None):
-                    idx = column_map.get(header_name, default_idx)
-                    if idx is None:
-                        return ''
-                    if idx < len(row) and row[idx].value is not None:
-                        value = row[idx].value
-                        # 處理不同類型的值
-                        if isinstance(value, (int, float)):
-                            # 數字類型直接轉字符串
-                            if isinstance(value, float) and value.is_integer():
-                                return str(int(value))
-                            return str(value)
-                        elif isinstance(value, datetime):
-                            # 日期時間類型轉字符串
-                            return value.strftime('%Y-%m-%d %H:%M:%S')
-                        else:
-                            # 字符串類型，確保正確編碼
-                            return str(value).strip()
-                    return ''
-                
-                # 按照標準欄位順序讀取：醫師、科別、性別、狀態、聯絡窗口、經營社群、醫師社群、合作品牌、報價區間
-                doctor_field = get_cell_value('醫師', 0).strip() if get_cell_value('醫師', 0) else ''
+                fields = parse_row(row)
                 
                 # 如果醫師欄位為空，跳過這一行
-                if not doctor_field:
-                    continue
-                
-                # 同時存到 name 和 email
-                name = doctor_field
-                email = doctor_field
-                
-                # 清理和驗證資料（按照標準欄位順序：醫師、科別、性別、狀態、聯絡窗口、合作品牌、報價區間、經營社群、醫師社群）
-                specialty = get_cell_value('科別', 1).strip() if get_cell_value('科別', 1) else None
-                gender = get_cell_value('性別', 2).strip() if get_cell_value('性別', 2) else None
-                status = (get_cell_value('狀態', 3) or '未聯繫').strip()
-                contact_person = get_cell_value('聯絡窗口', 4).strip() if get_cell_value('聯絡窗口', 4) else None
-                current_brand = get_cell_value('合作品牌', 5).strip() if get_cell_value('合作品牌', 5) else None
-                price_range = get_cell_value('報價區間', 6).strip() if get_cell_value('報價區間', 6) else None
-                has_social_media = get_cell_value('經營社群', 7).strip() if get_cell_value('經營社群', 7) else None
-                social_media_link = get_cell_value('醫師社群', 8).strip() if get_cell_value('醫師社群', 8) else None
-                
-                # 檢查是否已存在（用預載的 set 比對，不再逐行查資料庫）
-                if email in existing_emails or name in existing_names:
-                    errors.append(f"第 {row_num} 行：醫師 '{name or email}' 已存在，已跳過")
+                name = fields['name']
+                if not name:
                     continue
                 
-                # 創建新醫師記錄（按照標準欄位順序）
-                doctor = Doctor(
-                    name=name if name else None,  # 姓名
-                    email=email if email else None,  # Email
-                    specialty=specialty if specialty else None,  # 科別
-                    gender=gender if gender else None,  # 性別
-                    status=status if status else '未聯繫',  # 狀態
-                    contact_person=contact_person if contact_person else None,  # 聯絡窗口
-                    has_social_media=has_social_media if has_social_media else None,  # 經營社群
-                    social_media_link=social_media_link if social_media_link else None,  # 醫師社群
-                    current_brand=current_brand if current_brand else None,  # 合作品牌
-                    price_range=price_range if price_range else None  # 報價區間
-                )
+                # 檢查是否已存在（用預載的 set 比對，不再逐行查資料庫；檔案內重複的醫師也會跳過）
+                if mode != 'upsert':
+                    if name in existing_emails or name in existing_names:
+                        errors.append(f"第 {row_num} 行：醫師 '{name}' 已存在，已跳過")
+                        continue
+                    existing_emails.add(name)
+                    existing_names.add(name)
                 
-                doctors_to_add.append(doctor)
-                success_count += 1
+                # 建立新醫師資料列（Core 批量寫入不會經過模型的 validates，報價數字在這裡解析）
+                fields['email'] = name  # 醫師欄位同時存到 name 和 email
+                # 狀態：skip 模式空白預設「未聯繫」；upsert 模式保留 None，由 upsert_rows 決定
+                if not fields['status'] and mode != 'upsert':
+                    fields['status'] = '未聯繫'
+                fields['price_min'], fields['price_max'] = parse_price_range(fields['price_range'])
+                pending_rows.append((row_num, fields))
                 
-                # 批量提交以提高效率
-                if len(doctors_to_add) >= batch_size:
-                    try:
-                        for doc in doctors_to_add:
-                            db.session.add(doc)
-                        db.session.commit()
-                        doctors_to_add = []
-                    except Exception as batch_error:
-                        db.session.rollback()
-                        errors.append(f"第 {row_num} 行批量提交失敗：{str(batch_error)}")
-                        # 嘗試逐筆添加
-                        for doc in doctors_to_add:
-                            try:
-                                db.session.add(doc)
-                                db.session.commit()
-                            except Exception as single_error:
-                                db.session.rollback()
-                                errors.append(f"醫師 '{doc.email}' 添加失敗：{str(single_error)}")
-                                success_count -= 1  # 扣除失敗的計數
-                        doctors_to_add = []
+                # 批量寫入以提高效率
+                if len(pending_rows) >= BULK_BATCH_SIZE:
+                    success_count += write_batch(db, pending_rows, errors, execute)
+                    pending_rows = []
+                    if progress:
+                        progress(rows_read, success_count, errors, total_rows)
                 
             except Exception as e:
                 errors.append(f"第 {row_num} 行處理失敗：{str(e)}")
                 continue
         
-        # 提交剩餘的資料
-        if doctors_to_add:
-            try:
-                for doc in doctors_to_add:
-                    db.session.add(doc)
-                db.session.commit()
-            except Exception as batch_error:
-                db.session.rollback()
-                errors.append(f"批量提交剩餘資料失敗：{str(batch_error)}")
-                # 嘗試逐筆添加
-                for doc in doctors_to_add:
-                    try:
-                        db.session.add(doc)
-                        db.session.commit()
-                    except Exception as single_error:
-                        db.session.rollback()
-                        errors.append(f"醫師 '{doc.email}' 添加失敗：{str(single_error)}")
-                        success_count -= 1  # 扣除失敗的計數
+        # 寫入剩餘的資料
+        if pending_rows:
+            success_count += write_batch(db, pending_rows, errors, execute)
+        if progress:
+            progress(rows_read, success_count, errors, total_rows)
         
         # 關閉工作簿
         wb.close()
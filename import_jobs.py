@@ -0,0 +1,117 @@
+"""
+背景匯入工作
+
+上傳的檔案先存到暫存目錄，建立一筆 ImportJob 後立即回應 job_id，
+實際匯入交給執行緒池執行，不佔用處理請求的 worker，也不會碰到 gunicorn 的請求逾時。
+進度寫在資料庫的 import_job 資料表，多個 worker 時任何一個都能回答進度查詢。
+
+執行匯入的 worker 被重啟或砍掉時，工作會停在 queued / running。進度超過 IMPORT_STALE_SECONDS 秒
+（預設 600）沒有更新的工作，查詢進度時改記為失敗；排隊中的工作只要還有其他工作在持續更新進度就繼續等待。
+"""
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from events import change_notifier
+from stats_cache import stats_cache
+
+# 同時執行的匯入工作數；大量寫入互相搶鎖沒有好處，預設一次一個，其餘排隊
+IMPORT_WORKERS = int(os.environ.get('IMPORT_WORKERS', 1))
+
+# 進度多久沒有更新視為中斷（秒）；每批寫入都會更新，需大於單批匯入的時間
+IMPORT_STALE_SECONDS = int(os.environ.get('IMPORT_STALE_SECONDS', 600))
+
+# 進度中保留的錯誤訊息筆數（完整筆數記在 error_count）
+MAX_JOB_ERRORS = 200
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='import')
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def submit_import_job(app, db, ImportJob, Doctor, job_id, file_path, mode):
+    """把匯入工作交給執行緒池（ImportJob 資料列須已建立）"""
+    _executor.submit(run_import_job, app, db, ImportJob, Doctor, job_id, file_path, mode)
+
+
+def _update_job(db, ImportJob, job_id, **values):
+    # 用獨立的連線更新進度，不受匯入本身 session 的 commit / rollback 影響
+    values['updated_at'] = datetime.utcnow()
+    with db.engine.begin() as conn:
+        conn.execute(ImportJob.__table__.update().where(ImportJob.__table__.c.id == job_id).values(**values))
+
+
+def expire_stale_job(db, ImportJob, job):
+    """工作停在 queued / running 且進度太久沒有更新時改記為失敗；回傳是否有更新"""
+    if job.status not in ('queued', 'running') or job.updated_at is None:
+        return False
+    cutoff = datetime.utcnow() - timedelta(seconds=IMPORT_STALE_SECONDS)
+    if job.updated_at >= cutoff:
+        return False
+    if job.status == 'queued':
+        # 前面的工作還在進行時只是排隊中
+        busy = db.session.query(ImportJob.id).filter(
+            ImportJob.status == 'running', ImportJob.updated_at >= cutoff
+        ).first()
+        if busy is not None:
+            return False
+    table = ImportJob.__table__
+    message = f'匯入中斷：超過 {IMPORT_STALE_SECONDS} 秒沒有進度（伺服器可能已重新啟動），請重新匯入'
+    # 只在狀態與進度時間都沒變時更新，避免蓋掉剛好寫入的進度
+    with db.engine.begin() as conn:
+        result = conn.execute(
+            table.update()
+            .where(table.c.id == job.id, table.c.status == job.status, table.c.updated_at == job.updated_at)
+            .values(status='failed', finished_at=datetime.utcnow(), updated_at=datetime.utcnow(),
+                    error_count=(job.error_count or 0) + 1,
+                    errors=json.dumps(([message] + json.loads(job.errors or '[]'))[:MAX_JOB_ERRORS],
+                                      ensure_ascii=False))
+        )
+    return result.rowcount > 0
+
+
+def run_import_job(app, db, ImportJob, Doctor, job_id, file_path, mode):
+    """在背景執行緒中執行匯入，逐批回寫進度，結束後刪除暫存檔"""
+    from import_data import import_doctors_from_excel
+
+    with app.app_context():
+        try:
+            _update_job(db, ImportJob, job_id, status='running', started_at=datetime.utcnow())
+
+            def progress(rows_read, success_count, errors, total_rows):
+                change_notifier.notify()  # 每批寫入後喚醒同一個 worker 的 SSE 連線
+                _update_job(db, ImportJob, job_id,
+                            rows_processed=rows_read,
+                            success_count=success_count,
+                            error_count=len(errors),
+                            total_rows=total_rows,
+                            errors=json.dumps(errors[:MAX_JOB_ERRORS], ensure_ascii=False))
+
+            result = import_doctors_from_excel(file_path, db, Doctor, mode=mode, progress=progress)
+            errors = result.get('errors', [])
+            _update_job(db, ImportJob, job_id,
+                        status='succeeded' if result.get('success') else 'failed',
+                        success_count=result.get('success_count', 0),
+                        error_count=len(errors),
+                        errors=json.dumps(errors[:MAX_JOB_ERRORS], ensure_ascii=False),
+                        finished_at=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            try:
+                _update_job(db, ImportJob, job_id, status='failed', finished_at=datetime.utcnow(),
+                            error_count=1, errors=json.dumps([f'匯入失敗：{str(e)}'], ensure_ascii=False))
+            except Exception as update_error:
+                print(f"更新匯入工作 {job_id} 狀態失敗: {update_error}")
+        finally:
+            # 匯入寫入的筆數不逐筆追蹤，統計改為下次讀取時重新計算
+            stats_cache.mark_stale()
+            change_notifier.notify()
+            if file_path and os.path.exists(file_path):
+                try:
+                    os.remove(file_path)
+                except Exception as cleanup_error:
+                    print(f"清理臨時檔案失敗: {cleanup_error}")
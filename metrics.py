@@ -0,0 +1,263 @@
+"""
+請求與 SQL 監控
+
+每個請求記錄：耗時、SQL 數量與總耗時（SQLAlchemy before/after_cursor_execute 事件）、
+回應大小、回傳筆數（路由呼叫 record_rows）。串流回應（匯出）在送完最後一塊時才記錄，
+所以耗時與 SQL 包含整個串流過程。
+
+    /metrics        Prometheus 文字格式（管理員登入，或 Authorization: Bearer $METRICS_TOKEN）
+    ?profile=1      管理員在任何路由加上這個參數，回應改為該請求的 cProfile 報告
+    METRICS_LOG=1   每個請求印出一行摘要
+
+數字保存在各 worker 程序內，Prometheus 需個別抓取每個 worker（或只看單一 worker 的趨勢）。
+"""
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import defaultdict
+
+from flask import Response, g, has_request_context, request, session
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_LOG = os.environ.get('METRICS_LOG', '0') in ('1', 'true', 'True')
+
+# 請求耗時的直方圖區間（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 每個請求 SQL 數量的直方圖區間
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 1000)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.total += 1
+        self.sum += value
+
+
+class Registry:
+    """以 (指標名稱, 標籤) 為鍵的計數器與直方圖"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = defaultdict(float)  # (name, labels) -> 值
+        self.histograms = {}  # (name, labels) -> _Histogram
+        self.help = {}
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            self.counters[(name, labels)] += value
+
+    def observe(self, name, labels, value, buckets):
+        with self._lock:
+            key = (name, labels)
+            if key not in self.histograms:
+                self.histograms[key] = _Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def render(self):
+        """輸出 Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            seen = set()
+            for (name, labels), value in counters:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {self.help.get(name, name)}')
+                    lines.append(f'# TYPE {name} counter')
+                lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            for (name, labels), histogram in histograms:
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f'# HELP {name} {self.help.get(name, name)}')
+                    lines.append(f'# TYPE {name} histogram')
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{name}_bucket{_labels(labels + (("le", _number(bound)),))} {count}')
+                lines.append(f'{name}_bucket{_labels(labels + (("le", "+Inf"),))} {histogram.total}')
+                lines.append(f'{name}_sum{_labels(labels)} {_number(histogram.sum)}')
+                lines.append(f'{name}_count{_labels(labels)} {histogram.total}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (f'{key}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for key, value in labels)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+registry = Registry()
+registry.help.update({
+    'http_requests_total': '請求數',
+    'http_request_duration_seconds': '請求耗時（秒，串流回應包含送出時間）',
+    'http_response_bytes_total': '回應大小（位元組，壓縮後）',
+    'http_rows_returned_total': '回傳的資料筆數',
+    'sql_statements_total': 'SQL 執行次數',
+    'sql_duration_seconds_total': 'SQL 執行總耗時（秒）',
+    'sql_statements_per_request': '每個請求的 SQL 數量',
+})
+
+
+class RequestStats:
+    """一個請求的累計數字（存在 g，串流期間也會持續累加）"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.rows = None
+        self.bytes = 0
+
+
+def record_rows(count):
+    """路由回報本次回傳的資料筆數"""
+    stats = g.get('request_stats') if has_request_context() else None
+    if stats is not None:
+        stats.rows = count
+
+
+def count_rows(rows):
+    """包住匯出的資料列，邊讀邊累計回傳筆數（串流結束時才知道總數）"""
+    stats = g.get('request_stats') if has_request_context() else None
+    if stats is not None:
+        stats.rows = 0
+    for row in rows:
+        if stats is not None:
+            stats.rows += 1
+        yield row
+
+
+def _route_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('query_start')
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    if has_request_context():
+        stats = g.get('request_stats')
+        route = _route_label()
+    else:
+        stats, route = None, 'background'  # 背景匯入等不在請求中的 SQL
+    registry.inc('sql_statements_total', (('route', route),))
+    registry.inc('sql_duration_seconds_total', (('route', route),), elapsed)
+    if stats is not None:
+        stats.sql_count += 1
+        stats.sql_seconds += elapsed
+
+
+def _counting(chunks, stats):
+    # 串流回應：邊送邊計算大小
+    try:
+        for chunk in chunks:
+            stats.bytes += len(chunk)
+            yield chunk
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def _finish(stats, method, route, status):
+    elapsed = time.perf_counter() - stats.start
+    labels = (('method', method), ('route', route))
+    registry.inc('http_requests_total', labels + (('status', str(status)),))
+    registry.observe('http_request_duration_seconds', labels, elapsed, LATENCY_BUCKETS)
+    registry.observe('sql_statements_per_request', labels, stats.sql_count, SQL_COUNT_BUCKETS)
+    registry.inc('http_response_bytes_total', labels, stats.bytes)
+    if stats.rows is not None:
+        registry.inc('http_rows_returned_total', labels, stats.rows)
+    if METRICS_LOG:
+        rows = f' rows={stats.rows}' if stats.rows is not None else ''
+        print(f"{method} {route} {status} {elapsed * 1000:.1f}ms "
+              f"sql={stats.sql_count}/{stats.sql_seconds * 1000:.1f}ms bytes={stats.bytes}{rows}")
+
+
+def _start_request():
+    g.request_stats = RequestStats()
+    if request.args.get('profile') == '1' and session.get('is_admin'):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # 同一程序已有另一個 profile 中的請求，這次不分析
+            return
+        g.profiler = profiler
+
+
+def _end_request(response):
+    stats = g.get('request_stats')
+    if stats is None:
+        return response
+
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(60)
+        header = (f'{request.method} {request.full_path} -> {response.status_code}\n'
+                  f'SQL: {stats.sql_count} 次，{stats.sql_seconds * 1000:.1f} ms\n\n')
+        # 串流回應只量到開始串流前的部分；原本的回應不會送出，要關閉以釋放資料庫游標
+        response.close()
+        response = Response(header + report.getvalue(), mimetype='text/plain')
+
+    method, route, status = request.method, _route_label(), response.status_code
+    if response.direct_passthrough:
+        # send_file：檔案已經產生好，直接交給伺服器傳送（不會觸發 call_on_close），在這裡記錄
+        stats.bytes = response.content_length or 0
+        _finish(stats, method, route, status)
+        return response
+
+    if response.is_streamed:
+        response.response = _counting(response.response, stats)
+    else:
+        stats.bytes = response.calculate_content_length() or 0
+        elapsed = (time.perf_counter() - stats.start) * 1000
+        response.headers['Server-Timing'] = f'db;dur={stats.sql_seconds * 1000:.1f}, app;dur={elapsed:.1f}'
+    # 回應送完（串流結束）才記錄，耗時包含整個串流
+    response.call_on_close(lambda: _finish(stats, method, route, status))
+    return response
+
+
+def metrics_response():
+    """/metrics：管理員或帶正確 token 的請求才能讀取"""
+    authorized = session.get('is_admin')
+    if METRICS_TOKEN and request.headers.get('Authorization') == f'Bearer {METRICS_TOKEN}':
+        authorized = True
+    if not authorized:
+        return Response('forbidden\n', status=403, mimetype='text/plain')
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+def init_metrics(app):
+    """註冊請求計時與 SQL 事件；需在 init_compression 之前呼叫，才會量到壓縮後的大小"""
+    app.before_request(_start_request)
+    app.after_request(_end_request)
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    app.add_url_rule('/metrics', 'metrics', metrics_response)
@@ -0,0 +1,87 @@
+"""
+醫師列表的 keyset 分頁工具
+
+cursor 是把上一頁最後一筆的 (排序值, id) 編成 base64 的不透明字串，
+下一頁直接用 WHERE (排序值, id) > (cursor) 往後取，
+所以第 1000 頁和第 1 頁的查詢成本相同，不需要 OFFSET。
+"""
+import base64
+import json
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def parse_limit(raw):
+    """解析 limit 參數，空值使用預設值，超過上限時截斷"""
+    if raw in (None, ''):
+        return DEFAULT_PAGE_SIZE
+    limit = int(raw)
+    if limit < 1:
+        raise ValueError('limit 必須大於 0')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort_value, row_id):
+    """把最後一筆的排序值與 id 編成不透明的 cursor 字串"""
+    payload = json.dumps([sort_value, row_id], ensure_ascii=False, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """解析 cursor，回傳 (排序值, id)；沒有 cursor 時回傳 None"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('cursor 格式錯誤')
+    if not isinstance(row_id, int) or isinstance(row_id, bool):
+        raise ValueError('cursor 格式錯誤')
+    # 排序值會直接帶入 SQL 參數，只接受排序運算式可能的型別（物件、陣列會讓資料庫驅動程式出錯）；
+    # 排序運算式都不會是 NULL，None 也無法用來比較大小
+    if isinstance(sort_value, bool) or not isinstance(sort_value, (str, int, float)):
+        raise ValueError('cursor 格式錯誤')
+    return sort_value, row_id
+
+
+def apply_keyset(query, sort_expr, id_column, cursor, descending=False):
+    """依 (sort_expr, id) 排序並套用 cursor 條件"""
+    if cursor is not None:
+        sort_value, row_id = cursor
+        if descending:
+            query = query.filter(or_(
+                sort_expr < sort_value,
+                and_(sort_expr == sort_value, id_column < row_id)
+            ))
+        else:
+            query = query.filter(or_(
+                sort_expr > sort_value,
+                and_(sort_expr == sort_value, id_column > row_id)
+            ))
+
+    if descending:
+        return query.order_by(sort_expr.desc(), id_column.desc())
+    return query.order_by(sort_expr.asc(), id_column.asc())
+
+
+def paginate(query, sort_expr, id_column, limit, cursor, descending=False):
+    """
+    執行 keyset 分頁查詢
+
+    query 回傳的資料列必須有 id 與 sort_key 兩個欄位（例如 with_entities(..., sort_expr.label('sort_key'))），
+    回傳 (本頁的資料列, next_cursor)；沒有下一頁時 next_cursor 為 None。
+    """
+    query = apply_keyset(query, sort_expr, id_column, cursor, descending)
+    rows = query.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.sort_key, last.id)
+
+    return rows, next_cursor
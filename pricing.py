@@ -0,0 +1,44 @@
+"""
+報價區間解析
+
+price_range 是自由輸入的文字（例如 "70,000(議)"、"10,000-50,000"），
+這裡把它解析成可以建立索引的數字欄位 price_min / price_max。
+"""
+import re
+
+# 超過 BIGINT 範圍的數字一律截斷，避免寫入資料庫時溢位
+MAX_PRICE = 2 ** 62 - 1
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def parse_price_range(price_range):
+    """
+    解析報價字串，回傳 (price_min, price_max)
+
+    price_min 為字串中的第一個數字（與前端原本的 extractPrice 規則一致），
+    price_max 為字串中最大的數字；沒有數字時兩者皆為 None。
+    """
+    if not price_range:
+        return None, None
+    numbers = [min(int(n), MAX_PRICE) for n in _NUMBER_RE.findall(str(price_range).replace(',', ''))]
+    if not numbers:
+        return None, None
+    return numbers[0], max(numbers)
+
+
+# 報價區間分組（與前端選單一致）：none 未填、low 未滿十萬、mid 十萬到三十萬、high 超過三十萬
+PRICE_BANDS = ('none', 'low', 'mid', 'high')
+PRICE_BAND_LOW = 100000
+PRICE_BAND_HIGH = 300000
+
+
+def price_band(price_min):
+    """依報價下限回傳所屬的報價區間分組（與 SQL 的 price_band_expression 規則相同）"""
+    if price_min is None:
+        return 'none'
+    if price_min < PRICE_BAND_LOW:
+        return 'low'
+    if price_min <= PRICE_BAND_HIGH:
+        return 'mid'
+    return 'high'
@@ -0,0 +1,102 @@
+"""
+醫師列表的查詢結果快取
+
+儀表板的查詢大多是同幾種篩選組合（空白搜尋、某個狀態、某個科別），
+這裡以正規化後的查詢參數（篩選、排序、分頁）為鍵，保存序列化後的回應內容，數量與總大小都有上限（LRU）。
+
+資料是否變動以資料庫中的版本號判斷：data_version 資料表每個名稱一列，
+新增、編輯、刪除醫師與匯入時在同一個交易內 bump_version()。每個請求只需一次主鍵查詢讀取版本號，
+其他 worker 寫入後所有 worker 都會看到新的版本，舊版本的快取全部失效。
+不經過程式直接修改資料庫（手動 SQL、腳本）不會更新版本號，需重新啟動或呼叫 bump_version()。
+
+    RESULT_CACHE_SIZE       最多保存幾組查詢結果（預設 256，0 表示關閉）
+    RESULT_CACHE_MAX_BYTES  快取內容總大小上限（預設 32 MB）
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import text
+
+RESULT_CACHE_SIZE = int(os.environ.get('RESULT_CACHE_SIZE', 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+DOCTORS = 'doctors'  # data_version 中醫師資料表的名稱
+
+
+def read_version(session, name=DOCTORS):
+    """目前的版本號；還沒有任何寫入時為 0"""
+    version = session.execute(
+        text('SELECT version FROM data_version WHERE name = :name'), {'name': name}
+    ).scalar()
+    return version or 0
+
+
+def ensure_version(session, name=DOCTORS):
+    """
+    啟動時建立版本號資料列（已存在則不動），由呼叫端 commit
+
+    有了這一列，bump_version() 只需要一次 UPDATE；多個 worker 同時第一次寫入也不會同時 INSERT 而撞到主鍵。
+    """
+    session.execute(
+        text('INSERT INTO data_version (name, version) SELECT :name, 0 '
+             'WHERE NOT EXISTS (SELECT 1 FROM data_version WHERE name = :name)'),
+        {'name': name}
+    )
+
+
+def bump_version(session, name=DOCTORS):
+    """版本號加一並回傳新的版本號；需與資料的寫入在同一個交易內，由呼叫端 commit"""
+    result = session.execute(
+        text('UPDATE data_version SET version = version + 1 WHERE name = :name'), {'name': name}
+    )
+    if result.rowcount == 0:
+        # 沒有執行過 ensure_version() 的資料庫（例如只跑了 db.create_all()）
+        session.execute(
+            text('INSERT INTO data_version (name, version) VALUES (:name, 1)'), {'name': name}
+        )
+    return read_version(session, name)
+
+
+class ResultCache:
+    """只保存同一個版本號的結果；讀到較新的版本時整個清空"""
+
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # 鍵 -> (內容 bytes, 其他資料)
+        self._bytes = 0
+        self._version = None
+
+    def _sync_version(self, version):
+        # 呼叫端須持有 _lock
+        if self._version is None or version > self._version:
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+        return version == self._version
+
+    def get(self, key, version):
+        """回傳 (內容, 其他資料)；沒有快取或版本不符時回傳 None"""
+        with self._lock:
+            entry = self._entries.get(key) if self._sync_version(version) else None
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, version, body, extra=None):
+        size = len(body)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            if not self._sync_version(version):
+                return  # 查詢期間已有更新的版本，這份結果不保存
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (body, extra)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
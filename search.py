@@ -0,0 +1,146 @@
+"""
+醫師名稱 / Email 搜尋引擎
+
+原本的 Doctor.name.contains(q) 會變成 LIKE '%q%'，永遠無法使用索引。
+這裡依資料庫提供不同的搜尋實作：
+
+- PostgreSQL：pg_trgm 擴充套件 + GIN trigram 索引（ILIKE '%q%' 可直接走索引），以 similarity() 排名
+- SQLite：FTS5 trigram 虛擬表，由觸發器與 doctor 表保持同步，以 bm25() 排名
+- 其他 / 建立失敗時：退回原本的 LIKE 搜尋
+
+可用環境變數 SEARCH_BACKEND 指定 auto（預設）、like、pg_trgm、fts5。
+"""
+import os
+import threading
+
+from sqlalchemy import Float, func, literal_column, or_, table, column, text
+
+
+class LikeSearch:
+    """原本的 LIKE '%q%' 搜尋（無索引、無排名）"""
+    name = 'like'
+
+    def setup(self, engine):
+        pass
+
+    def apply(self, query, Doctor, q):
+        return query.filter(or_(Doctor.email.contains(q), Doctor.name.contains(q)))
+
+    def rank_expression(self, Doctor, q):
+        return None
+
+
+class TrigramSearch(LikeSearch):
+    """PostgreSQL pg_trgm：GIN 索引加速 ILIKE，依 similarity 排名"""
+    name = 'pg_trgm'
+
+    def setup(self, engine):
+        with engine.begin() as conn:
+            conn.execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_doctor_name_trgm ON doctor USING gin (name gin_trgm_ops)'))
+            conn.execute(text('CREATE INDEX IF NOT EXISTS ix_doctor_email_trgm ON doctor USING gin (email gin_trgm_ops)'))
+
+    def apply(self, query, Doctor, q):
+        return query.filter(or_(
+            Doctor.email.icontains(q, autoescape=True),
+            Doctor.name.icontains(q, autoescape=True)
+        ))
+
+    def rank_expression(self, Doctor, q):
+        # 相似度越高越前面；取負值讓升冪排序即為最佳結果優先
+        # similarity() 是 real，驅動程式讀回的十進位值轉回 real 後與原值不一定相等，
+        # 轉成 double precision，分頁 cursor 帶回的排序值才能精確比較（同分的資料不會重複或遺漏）
+        similarity = func.greatest(func.similarity(Doctor.name, q), func.similarity(Doctor.email, q))
+        return -similarity.cast(Float(53))
+
+
+# FTS5 外部內容表：只存索引，實際資料仍在 doctor 表
+doctor_fts = table('doctor_fts', column('rowid'), column('doctor_fts'))
+
+FTS5_TRIGGERS = {
+    'doctor_fts_ai': '''
+        CREATE TRIGGER IF NOT EXISTS doctor_fts_ai AFTER INSERT ON doctor BEGIN
+            INSERT INTO doctor_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+        END''',
+    'doctor_fts_ad': '''
+        CREATE TRIGGER IF NOT EXISTS doctor_fts_ad AFTER DELETE ON doctor BEGIN
+            INSERT INTO doctor_fts(doctor_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+        END''',
+    'doctor_fts_au': '''
+        CREATE TRIGGER IF NOT EXISTS doctor_fts_au AFTER UPDATE OF name, email ON doctor BEGIN
+            INSERT INTO doctor_fts(doctor_fts, rowid, name, email) VALUES ('delete', old.id, old.name, old.email);
+            INSERT INTO doctor_fts(rowid, name, email) VALUES (new.id, new.name, new.email);
+        END''',
+}
+
+
+class Fts5Search(LikeSearch):
+    """SQLite FTS5 trigram 索引，依 bm25 排名"""
+    name = 'fts5'
+
+    # trigram 分詞至少需要 3 個字元才能比對，較短的關鍵字退回 LIKE
+    MIN_QUERY_LENGTH = 3
+
+    def setup(self, engine):
+        with engine.begin() as conn:
+            existing = {row.name for row in conn.execute(text(
+                "SELECT name FROM sqlite_master WHERE name = 'doctor_fts' OR (type = 'trigger' AND tbl_name = 'doctor')"
+            ))}
+            conn.execute(text(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS doctor_fts USING fts5("
+                "name, email, content='doctor', content_rowid='id', tokenize='trigram')"
+            ))
+            for sql in FTS5_TRIGGERS.values():
+                conn.execute(text(sql))
+            # 新建的索引表，或 doctor 表被重建過（觸發器不見了）時，從 doctor 表重建索引
+            if 'doctor_fts' not in existing or not set(FTS5_TRIGGERS) <= existing:
+                conn.execute(text("INSERT INTO doctor_fts(doctor_fts) VALUES ('rebuild')"))
+
+    def _use_fts(self, q):
+        return len(q) >= self.MIN_QUERY_LENGTH
+
+    def apply(self, query, Doctor, q):
+        if not self._use_fts(q):
+            return super().apply(query, Doctor, q)
+        # 整個關鍵字以雙引號包成一個片語，避免被解析成 FTS5 語法
+        phrase = '"' + q.replace('"', '""') + '"'
+        return (query
+                .join(doctor_fts, doctor_fts.c.rowid == Doctor.id)
+                .filter(doctor_fts.c.doctor_fts.op('MATCH')(phrase)))
+
+    def rank_expression(self, Doctor, q):
+        if not self._use_fts(q):
+            return None
+        # bm25 越小越相關
+        return func.bm25(literal_column('doctor_fts'))
+
+
+BACKENDS = {backend.name: backend for backend in (LikeSearch, TrigramSearch, Fts5Search)}
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend(engine):
+    """取得目前使用的搜尋引擎（第一次呼叫時建立所需的索引，失敗則退回 LIKE）"""
+    global _backend
+    if _backend is not None:
+        return _backend
+
+    with _backend_lock:
+        if _backend is not None:
+            return _backend
+
+        name = os.environ.get('SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            name = {'postgresql': 'pg_trgm', 'sqlite': 'fts5'}.get(engine.dialect.name, 'like')
+        backend = BACKENDS.get(name, LikeSearch)()
+
+        try:
+            backend.setup(engine)
+        except Exception as e:
+            print(f"搜尋引擎 {backend.name} 初始化失敗，改用 LIKE 搜尋: {e}")
+            backend = LikeSearch()
+
+        _backend = backend
+        return _backend
@@ -0,0 +1,49 @@
+"""
+醫師列表的 JSON 序列化
+
+列表查詢只選需要的欄位（tuple），不建立 ORM 物件、不經過 to_dict()；
+時間欄位用 str(dt)[:19] 取代 strftime，序列化優先使用 orjson（有安裝時）。
+format=columns 時回傳 {"columns": [...], "rows": [[...]]}，不必每筆重複欄位名稱。
+"""
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson 是選用套件，沒安裝時使用標準函式庫
+    orjson = None
+
+# 列表回應的欄位（與 Doctor.to_dict() 相同）
+LIST_COLUMNS = ['id', 'name', 'email', 'specialty', 'gender', 'status', 'contact_person',
+                'has_social_media', 'social_media_link', 'current_brand', 'price_range',
+                'created_at', 'updated_at']
+
+# 時間欄位的位置，只有這兩欄需要轉換
+_TIMESTAMP_INDEXES = (LIST_COLUMNS.index('created_at'), LIST_COLUMNS.index('updated_at'))
+
+LIST_FORMATS = ('objects', 'columns')
+
+
+def dumps(payload):
+    """序列化成 UTF-8 JSON bytes（中文不跳脫）"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def _row_values(row):
+    # datetime 的 str() 是 'YYYY-MM-DD HH:MM:SS[.ffffff]'，取前 19 碼與 to_dict() 的格式相同
+    values = list(row[:len(LIST_COLUMNS)])
+    for index in _TIMESTAMP_INDEXES:
+        if values[index] is not None:
+            values[index] = str(values[index])[:19]
+    return values
+
+
+def rows_to_objects(rows):
+    """[{欄位: 值}, ...]，與 to_dict() 的輸出相同"""
+    return [dict(zip(LIST_COLUMNS, _row_values(row))) for row in rows]
+
+
+def rows_to_columns(rows):
+    """{"columns": [...], "rows": [[...], ...]}"""
+    return {'columns': LIST_COLUMNS, 'rows': [_row_values(row) for row in rows]}
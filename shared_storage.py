@@ -0,0 +1,245 @@
+"""
+多個 worker 共用的限速計數與登入狀態
+
+預設的 Flask-Limiter 把計數放在各 worker 的記憶體裡，開多個 gunicorn worker 時每個 worker
+各自計算「每分鐘 5 次」，重啟後也會歸零。這裡提供以 SQLite 檔案保存的後端，
+同一台機器上的所有 worker 共用、重啟後仍然有效：
+
+    RATELIMIT_STORAGE_URI   限速計數（預設 sqlite:///shared_state.db；memory:// 為原本的記憶體模式，
+                            也可以用 Flask-Limiter 支援的 redis:// 等）
+    SESSION_STORAGE_URI     登入狀態（預設 sqlite:///shared_state.db；設為 cookie 改回 Flask 的簽章 cookie）
+
+相對路徑以啟動時的工作目錄為準。要支援其他後端時，限速參考 SQLiteStorage 繼承 limits 的 Storage
+並設定 STORAGE_SCHEME；登入狀態在 session_interface() 依網址開頭選擇對應的 SessionInterface。
+"""
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from flask.sessions import SessionInterface, SessionMixin
+from limits.storage import Storage
+from werkzeug.datastructures import CallbackDict
+
+DEFAULT_STORAGE_URI = 'sqlite:///shared_state.db'
+PURGE_INTERVAL = 300  # 每隔幾秒清除一次過期資料（秒）
+
+
+def sqlite_path(uri):
+    """sqlite:///相對或絕對路徑 -> 檔案的絕對路徑"""
+    path = uri.split(':///', 1)[1].split('?', 1)[0]
+    return os.path.abspath(path)
+
+
+class SQLiteStore:
+    """每個執行緒各自一條連線的 SQLite 檔案（fork 後的子程序會重新連線）"""
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+        self._last_purge = 0.0
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(self.schema)
+        self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def transaction(self):
+        """BEGIN IMMEDIATE：讀取與寫入之間不會被其他 worker 插隊"""
+        return _Transaction(self.connect())
+
+    def purge_due(self):
+        now = time.time()
+        if now - self._last_purge < PURGE_INTERVAL:
+            return False
+        self._last_purge = now
+        return True
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+
+
+RATELIMIT_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS ratelimit (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires REAL NOT NULL
+);
+'''
+
+
+class SQLiteStorage(Storage):
+    """
+    limits 的 SQLite 後端（固定時間窗；Flask-Limiter 預設的 fixed-window 策略）
+
+    設定 STORAGE_SCHEME 後 limits 會自動註冊，RATELIMIT_STORAGE_URI=sqlite:///檔案 即可使用。
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.store = SQLiteStore(sqlite_path(uri), RATELIMIT_SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def incr(self, key, expiry, elastic_expiry=False, amount=1):
+        now = time.time()
+        with self.store.transaction() as conn:
+            if self.store.purge_due():
+                conn.execute('DELETE FROM ratelimit WHERE expires <= ?', (now,))
+            else:
+                conn.execute('DELETE FROM ratelimit WHERE key = ? AND expires <= ?', (key, now))
+            conn.execute(
+                'INSERT INTO ratelimit (key, value, expires) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value'
+                + (', expires = excluded.expires' if elastic_expiry else ''),
+                (key, amount, now + expiry)
+            )
+            return conn.execute('SELECT value FROM ratelimit WHERE key = ?', (key,)).fetchone()[0]
+
+    def get(self, key):
+        row = self.store.connect().execute(
+            'SELECT value FROM ratelimit WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self.store.connect().execute(
+            'SELECT expires FROM ratelimit WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self.store.connect().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        with self.store.transaction() as conn:
+            return conn.execute('DELETE FROM ratelimit').rowcount
+
+    def clear(self, key):
+        with self.store.transaction() as conn:
+            conn.execute('DELETE FROM ratelimit WHERE key = ?', (key,))
+
+
+SESSION_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+'''
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    """內容存在伺服器端的 session；cookie 只放隨機的 session id"""
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.replaced_sid = None  # regenerate() 換掉的 session id，儲存時刪除
+
+    def regenerate(self):
+        """換一個新的 session id（登入時呼叫，避免沿用登入前的 session id：session fixation）"""
+        if self.replaced_sid is None and not self.new:
+            self.replaced_sid = self.sid
+        self.sid = secrets.token_urlsafe(32)
+        self.modified = True
+
+
+class SQLiteSessionInterface(SessionInterface):
+    """
+    session 內容存在 SQLite 檔案，所有 worker 共用
+
+    只有內容變動（登入、登出）時才寫入；登出清空 session 時一併刪除伺服器端的資料，
+    舊的 cookie 即使被保留下來也無法再使用。登入時 regenerate() 換發新的 session id 並刪除舊的資料列。
+    """
+
+    def __init__(self, uri):
+        self.store = SQLiteStore(sqlite_path(uri), SESSION_SCHEMA)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            row = self.store.connect().execute(
+                'SELECT data FROM sessions WHERE id = ? AND expires > ?', (sid, time.time())
+            ).fetchone()
+            if row:
+                return ServerSession(json.loads(row[0]), sid=sid)
+        return ServerSession(sid=secrets.token_urlsafe(32), new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        stale_ids = [session.replaced_sid] if session.replaced_sid else []
+        if not session:
+            if session.modified:
+                with self.store.transaction() as conn:
+                    for sid in stale_ids + [session.sid]:
+                        conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        if not self.should_set_cookie(app, session):
+            return
+
+        now = time.time()
+        with self.store.transaction() as conn:
+            if self.store.purge_due():
+                conn.execute('DELETE FROM sessions WHERE expires <= ?', (now,))
+            for sid in stale_ids:
+                conn.execute('DELETE FROM sessions WHERE id = ?', (sid,))
+            conn.execute(
+                'INSERT OR REPLACE INTO sessions (id, data, expires) VALUES (?, ?, ?)',
+                (session.sid, json.dumps(dict(session)),
+                 now + app.permanent_session_lifetime.total_seconds())
+            )
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain, path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+        )
+
+
+def session_interface(uri):
+    """依 SESSION_STORAGE_URI 回傳 SessionInterface；cookie（或空字串）回傳 None，沿用 Flask 預設"""
+    if not uri or uri == 'cookie':
+        return None
+    if uri.startswith('sqlite:///'):
+        return SQLiteSessionInterface(uri)
+    raise ValueError(f'不支援的 SESSION_STORAGE_URI：{uri}')
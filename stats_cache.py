@@ -0,0 +1,144 @@
+"""
+統計快取
+
+/api/stats 與 /api/facets 的數字保存在程序內的計數器中，
+以 (狀態, 科別, 性別, 經營社群, 報價區間) 為鍵，由一次 GROUP BY 查詢載入。
+新增、編輯、刪除醫師時直接增減計數；匯入或批次修改後標記為過期，下次讀取時重新計算。
+讀取前以資料版本號（result_cache.read_version）確認：其他 worker 寫入過（版本號不是這個程序
+最後看到或自己寫入的版本）就重新計算，各 worker 回應的數字一致。
+另外每隔 STATS_RECONCILE_SECONDS 秒重新計算一次，修正腳本直接寫入資料庫造成的差異。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+STATS_RECONCILE_SECONDS = int(os.environ.get('STATS_RECONCILE_SECONDS', 60))
+
+# 計數鍵的欄位順序（與 app.FACET_COLUMNS、app.facet_key 一致）
+FACET_FIELDS = ('status', 'specialty', 'gender', 'has_social_media', 'price_band')
+
+
+class StatsCache:
+    def __init__(self, reconcile_seconds=STATS_RECONCILE_SECONDS):
+        self.reconcile_seconds = reconcile_seconds
+        self._lock = threading.Lock()
+        self._counts = None  # Counter: 計數鍵 -> 筆數
+        self._stale = True
+        self._loaded_at = 0.0
+        self._snapshots = {}  # view 名稱 -> (payload, etag, last_modified)
+        self._last_modified = None
+        self._version = None  # sync_version() 最後看到的資料版本號
+
+    def _changed(self):
+        # 呼叫端須持有 _lock
+        self._snapshots = {}
+        self._last_modified = datetime.utcnow().replace(microsecond=0)
+
+    def snapshot(self, load, view='stats'):
+        """
+        回傳 (回應內容, ETag, Last-Modified)
+
+        load() 回傳 {計數鍵: 筆數}，只在過期或超過校正間隔時呼叫；
+        view 為 stats 或 facets，同一份計數組出不同的回應內容。
+        """
+        with self._lock:
+            expired = time.monotonic() - self._loaded_at > self.reconcile_seconds
+            if self._stale or expired:
+                counts = Counter(load())
+                self._stale = False
+                self._loaded_at = time.monotonic()
+                if counts != self._counts:
+                    self._counts = counts
+                    self._changed()
+            if view not in self._snapshots:
+                payload = VIEWS[view](self._counts)
+                # ETag 由內容計算，多個 worker 只要數字相同就會得到相同的 ETag
+                digest = hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:16]
+                self._snapshots[view] = (payload, f'{view}-{digest}', self._last_modified)
+            return self._snapshots[view]
+
+    def add(self, key, delta=1, version=None):
+        """
+        新增（delta=1）或刪除（delta=-1）一位醫師時更新計數
+
+        version 為這次寫入 bump_version() 後的版本號；計數停在前一個版本時才直接增減，
+        中間有其他 worker 的寫入則標記為過期。
+        """
+        self._apply({key: delta}, version)
+
+    def move(self, old_key, new_key, version=None):
+        """編輯醫師時，計數鍵從 old_key 改為 new_key"""
+        deltas = {} if old_key == new_key else {old_key: -1, new_key: 1}
+        self._apply(deltas, version)
+
+    def _apply(self, deltas, version):
+        with self._lock:
+            if version is not None:
+                if self._version is None or version != self._version + 1:
+                    self._stale = True
+                self._version = version
+            if self._stale or not deltas:
+                return
+            for key, delta in deltas.items():
+                self._counts[key] += delta
+                if self._counts[key] <= 0:
+                    del self._counts[key]
+            self._changed()
+
+    def mark_stale(self):
+        """大量寫入（匯入等）後呼叫，下次讀取時重新計算"""
+        with self._lock:
+            self._stale = True
+
+    def sync_version(self, version):
+        """
+        資料版本號（result_cache.read_version）改變時標記為過期
+
+        其他 worker 的寫入不會更新這個程序內的計數，讀取統計前以版本號確認；同一版本只重新計算一次。
+        """
+        with self._lock:
+            # 只看較新的版本；併發請求較早讀到的舊版本號不必重新計算
+            if self._version is None or version > self._version:
+                self._version = version
+                self._stale = True
+
+
+def _count_by(counts, field):
+    # 空字串與 NULL 都視為未填（None）
+    index = FACET_FIELDS.index(field)
+    result = Counter()
+    for key, count in counts.items():
+        result[key[index] or None] += count
+    return result
+
+
+def build_stats(counts):
+    """/api/stats 的回應內容：總數、已簽約、合作過，以及依狀態、科別的筆數"""
+    by_status = _count_by(counts, 'status')
+    by_specialty = _count_by(counts, 'specialty')
+    return {
+        'total': sum(counts.values()),
+        'contracted': by_status.get('已簽約', 0),
+        'cooperated': by_status.get('合作過', 0),
+        'by_status': {status or '': count for status, count in by_status.items()},
+        'by_specialty': {specialty or '': count for specialty, count in by_specialty.items()},
+    }
+
+
+def build_facets(counts):
+    """/api/facets 的回應內容：每個維度的 [{value, count}]，依筆數由多到少排序"""
+    facets = {}
+    for field in FACET_FIELDS:
+        values = _count_by(counts, field)
+        facets[field] = [{'value': value, 'count': count}
+                         for value, count in sorted(values.items(), key=lambda item: (-item[1], item[0] or ''))]
+    return {'total': sum(counts.values()), 'facets': facets}
+
+
+VIEWS = {'stats': build_stats, 'facets': build_facets}
+
+stats_cache = StatsCache()
@@ -0,0 +1,130 @@
+"""
+資料庫非破壞性升級腳本
+
+db.create_all() 只會建立不存在的資料表，不會替既有資料表加欄位或索引。
+這個腳本會：
+1. 補上缺少的欄位（price_min、price_max）
+2. 依 price_range 回填報價數字欄位
+3. 建立缺少的索引（篩選欄位、複合索引、報價索引、醫師名稱唯一索引）
+4. 建立搜尋索引（PostgreSQL pg_trgm / SQLite FTS5）
+5. 建立資料版本號（data_version）的初始資料列
+
+可重複執行，不會刪除任何資料。
+"""
+from app import app, db, Doctor, find_schema_drift
+from pricing import parse_price_range
+from result_cache import ensure_version
+from search import get_search_backend
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+# 需要補上的欄位：欄位名稱 → SQL 型別
+NEW_COLUMNS = {
+    'price_min': 'BIGINT',
+    'price_max': 'BIGINT',
+}
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def add_missing_columns():
+    """補上既有 doctor 資料表缺少的欄位"""
+    missing_columns, _ = find_schema_drift()
+    added = []
+    with db.engine.begin() as conn:
+        for name, sql_type in NEW_COLUMNS.items():
+            if name in missing_columns:
+                conn.execute(text(f'ALTER TABLE doctor ADD COLUMN {name} {sql_type}'))
+                added.append(name)
+    if added:
+        print(f"已新增欄位: {', '.join(added)}")
+    else:
+        print("欄位已是最新")
+
+
+def backfill_price_columns():
+    """依 price_range 重新計算 price_min / price_max（以 id 分批處理）"""
+    table = Doctor.__table__
+    last_id = 0
+    updated = 0
+    while True:
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                db.select(table.c.id, table.c.price_range, table.c.price_min, table.c.price_max)
+                .where(table.c.id > last_id)
+                .order_by(table.c.id)
+                .limit(BACKFILL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+
+            changes = []
+            for row in rows:
+                price_min, price_max = parse_price_range(row.price_range)
+                if (price_min, price_max) != (row.price_min, row.price_max):
+                    changes.append({'row_id': row.id, 'price_min': price_min, 'price_max': price_max})
+
+            if changes:
+                conn.execute(
+                    table.update()
+                    .where(table.c.id == db.bindparam('row_id'))
+                    .values(
+                        price_min=db.bindparam('price_min'),
+                        price_max=db.bindparam('price_max'),
+                        updated_at=table.c.updated_at  # 回填不算資料異動，保留原本的更新時間
+                    ),
+                    changes
+                )
+            updated += len(changes)
+            last_id = rows[-1].id
+    print(f"已回填 {updated} 筆報價數字")
+
+
+def create_missing_indexes():
+    """建立模型中定義、但資料庫中還不存在的索引"""
+    _, missing_indexes = find_schema_drift()
+    created = []
+    for index in missing_indexes:
+        try:
+            index.create(bind=db.engine)
+            created.append(index.name)
+        except IntegrityError:
+            # 唯一索引：既有資料有重複值時無法建立，列出重複的值讓使用者先處理
+            columns = [column.name for column in index.columns]
+            print(f"⚠️ 無法建立唯一索引 {index.name}，以下 {', '.join(columns)} 有重複資料，請先合併或刪除：")
+            for row in find_duplicates(columns):
+                print(f"   {row}")
+    if created:
+        print(f"已建立索引: {', '.join(created)}")
+    elif not missing_indexes:
+        print("索引已是最新")
+
+
+def find_duplicates(columns, limit=20):
+    """列出指定欄位組合重複的值與筆數"""
+    table = Doctor.__table__
+    cols = [table.c[name] for name in columns]
+    with db.engine.connect() as conn:
+        return conn.execute(
+            db.select(*cols, db.func.count().label('count'))
+            .group_by(*cols)
+            .having(db.func.count() > 1)
+            .limit(limit)
+        ).all()
+
+
+def upgrade_database():
+    """執行所有升級步驟"""
+    with app.app_context():
+        db.create_all()
+        ensure_version(db.session)
+        db.session.commit()
+        add_missing_columns()
+        backfill_price_columns()
+        create_missing_indexes()
+        print(f"搜尋引擎: {get_search_backend(db.engine).name}")
+        print("資料庫升級完成")
+
+
+if __name__ == '__main__':
+    upgrade_database()